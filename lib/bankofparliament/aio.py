@@ -0,0 +1,262 @@
+"""
+Module for asynchronous reconcile and search requests
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import asyncio
+import urllib.parse
+
+# third party libs
+import aiohttp
+
+# local libs
+from . import utils, ratelimit
+from .constants import (
+    HEADERS,
+    QUERY_LIMIT,
+    RECONCILE_BATCH_SIZE,
+    REQUEST_MAX_RETRIES,
+    RECONCILE_HOST_LIMITS,
+    DEFAULT_HOST_LIMITS,
+    OPENCORPORATES_RECONCILE_URL,
+    FINDTHATCHARITY_RECONCILE_URL,
+)
+from .utils import (
+    reconcile_query_params,
+    match_companies_house_items,
+    companies_house_search_url,
+    reconcile_cache_get,
+    reconcile_cache_set,
+    chunks,
+)
+
+
+class AsyncReconcileClient:
+    """Asyncio http client, limiting concurrency and request rate per host"""
+
+    def __init__(self, logger, host_limits=None):
+        """Initialise the client, use as an async context manager"""
+        self.logger = logger
+        self.host_limits = host_limits or RECONCILE_HOST_LIMITS
+        self.session = None
+
+        self._semaphores = {}
+        self._buckets = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(headers=HEADERS)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+
+    def get_host_limits(self, host):
+        """Get the (concurrent requests, requests per second) limits for a host"""
+        return self.host_limits.get(host, DEFAULT_HOST_LIMITS)
+
+    def get_semaphore(self, host):
+        """Get the semaphore limiting concurrent requests to a host"""
+        if host not in self._semaphores:
+            (concurrency, _rate) = self.get_host_limits(host)
+            self._semaphores[host] = asyncio.Semaphore(concurrency)
+        return self._semaphores[host]
+
+    def get_bucket(self, host):
+        """Get the token bucket limiting the request rate to a host"""
+        bucket = ratelimit.get_bucket(host, self.host_limits)
+        if bucket is None:
+            if host not in self._buckets:
+                (concurrency, rate) = self.get_host_limits(host)
+                self._buckets[host] = ratelimit.TokenBucket(rate, capacity=concurrency)
+            bucket = self._buckets[host]
+        return bucket
+
+    async def throttle(self, host):
+        """Wait until the host's request rate allows another request"""
+        delay = self.get_bucket(host).reserve()
+        if delay > 0:
+            ratelimit.metrics.add_throttled(host, delay)
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url, user=None, params=None):
+        """
+        General purpose asynchronous json request, refused requests are
+        retried with backoff, honouring any Retry-After header
+        """
+        host = urllib.parse.urlparse(url).hostname
+        auth = aiohttp.BasicAuth(user, "") if user else None
+        query = query_items(params)
+
+        async with self.get_semaphore(host):
+            for attempt in range(REQUEST_MAX_RETRIES + 1):
+                await self.throttle(host)
+                async with self.session.get(url, params=query, auth=auth) as response:
+
+                    # successfull request
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+
+                    # too many requests or temporarily unavailable
+                    if response.status not in [429, 503]:
+                        return None
+                    if attempt == REQUEST_MAX_RETRIES:
+                        break
+
+                    retry_after = ratelimit.parse_retry_after(
+                        response.headers.get("Retry-After")
+                    )
+                    delay = ratelimit.backoff_delay(attempt, retry_after)
+                    self.get_bucket(host).pause(delay)
+                    ratelimit.metrics.add_retry(host, delay)
+                    self.logger.warning(
+                        "Request refused ({}), retry {}/{} in {:.1f} seconds".format(
+                            response.status, attempt + 1, REQUEST_MAX_RETRIES, delay
+                        )
+                    )
+                await asyncio.sleep(delay)
+
+        self.logger.debug("Request failed: {}".format(url))
+        return None
+
+
+def query_items(params):
+    """Flatten request parameters, list values become repeated keys"""
+    items = []
+    for (key, value) in (params or {}).items():
+        values = value if isinstance(value, list) else [value]
+        for _value in values:
+            items.append((key, str(_value)))
+    return items
+
+
+async def cached_fetch_async(endpoint, query, fetch_coroutine, params=None):
+    """Await fetch_coroutine, via the reconcile cache when one is set"""
+    cache = utils.reconcile_cache
+    if cache is None:
+        return await fetch_coroutine()
+
+    response = cache.get(endpoint, query, params)
+    if response is cache.MISSING:
+        response = await fetch_coroutine()
+        if response is not None:
+            cache.set(endpoint, query, response, params)
+    return response
+
+
+############################################################################
+# reconcile functions
+async def reconcile_opencorporates_entities_by_name_async(
+    client,
+    names,
+    logger,
+    jurisdiction="gb",
+    limit=QUERY_LIMIT,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """Reconcile many company names to opencorporates records, in batched requests"""
+    return await reconcile_entities_by_name_async(
+        client,
+        names,
+        logger,
+        endpoint="opencorporates",
+        url=OPENCORPORATES_RECONCILE_URL,
+        cache_params={"jurisdiction": jurisdiction, "limit": limit},
+        limit=limit,
+        jurisdiction=jurisdiction,
+        chunk_size=chunk_size,
+    )
+
+
+async def reconcile_findthatcharity_entities_by_name_async(
+    client,
+    names,
+    logger,
+    end_point="all",
+    limit=QUERY_LIMIT,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """Reconcile many names to findthatcharity records, in batched requests"""
+    return await reconcile_entities_by_name_async(
+        client,
+        names,
+        logger,
+        endpoint="findthatcharity",
+        url=FINDTHATCHARITY_RECONCILE_URL.format(end_point),
+        cache_params={"end_point": end_point, "limit": limit},
+        limit=limit,
+        chunk_size=chunk_size,
+    )
+
+
+async def reconcile_entities_by_name_async(
+    client,
+    names,
+    logger,
+    endpoint,
+    url,
+    cache_params,
+    limit=QUERY_LIMIT,
+    jurisdiction=None,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """
+    Reconcile many names using multiple queries per request, with the
+    requests for all chunks awaited concurrently
+    """
+    reconciled = {}
+    pending = []
+    for name in dict.fromkeys(names):
+        cached = reconcile_cache_get(endpoint, name, cache_params)
+        if cached is None:
+            pending.append(name)
+        else:
+            reconciled[name] = {"result": cached}
+
+    async def _reconcile_chunk(chunk):
+        logger.debug("reconcile_entities_by_name: {} ({})".format(endpoint, len(chunk)))
+        params = reconcile_query_params(chunk, limit, jurisdiction)
+        data = await client.get_json(url, params=params)
+        if data is None:
+            return
+
+        for (index, name) in enumerate(chunk):
+            results = data.get("q{}".format(index), {}).get("result", [])
+            reconcile_cache_set(endpoint, name, results, cache_params)
+            reconciled[name] = {"result": results}
+
+    await asyncio.gather(
+        *[_reconcile_chunk(chunk) for chunk in chunks(pending, chunk_size)]
+    )
+    return reconciled
+
+
+############################################################################
+# search functions
+async def search_companies_house_async(
+    client,
+    query,
+    companies_house_apikey,
+    logger,
+    query_type="",
+    limit=QUERY_LIMIT,
+):
+    """Search companies with text"""
+    query = query.lower().strip()
+    url = companies_house_search_url(query, query_type, limit)
+
+    async def _fetch():
+        data = await client.get_json(url, user=companies_house_apikey)
+        if data is not None:
+            return data.get("items", [])
+        return None
+
+    items = await cached_fetch_async(
+        "companies_house_search",
+        query,
+        _fetch,
+        params={"query_type": query_type, "limit": limit},
+    )
+    if items is None:
+        return (None, None, None)
+    return match_companies_house_items(query, items, logger)
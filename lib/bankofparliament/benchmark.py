@@ -0,0 +1,378 @@
+"""
+Module for benchmarking extraction and loading hot spots
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import os
+import re
+import sys
+import time
+import logging
+import resource
+import tempfile
+import subprocess
+
+# third party libs
+from bs4 import BeautifulSoup
+
+# local libs
+from .utils import read_csv_as_dataframe, read_json_file, iter_json_items
+from .graphdb import GraphDB
+from .convert import Convert, parse_regmem_html
+from .patterns import IN_PARENTHESIS, POSITIONS
+from .text import (
+    eval_string_as_list,
+    clean_up_significant_control,
+    clean_up_directorship,
+    strip_positions_text,
+    strip_category_text,
+    find_text_within_parenthesis_excluding_other_parenthesis,
+    has_consecutive_capital_letters_within_parenthesis,
+    POSITIONS_REGEX,
+)
+
+
+# run in a fresh interpreter, so each conversion's peak rss is its own
+CONVERT_RSS_SCRIPT = (
+    "import sys; "
+    "from bankofparliament.benchmark import run_convert; "
+    "print(run_convert(*sys.argv[1:]))"
+)
+
+
+def time_call(function, *args, **kwargs):
+    """Time, in seconds, of a single call"""
+    time_start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - time_start
+
+
+def time_calls(function, texts, repeat=3):
+    """Best time, in seconds, of calling function on every text"""
+    best = None
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        for text in texts:
+            function(text)
+        taken = time.perf_counter() - time_start
+        best = taken if best is None else min(best, taken)
+    return best
+
+
+def read_relationship_texts(relationships_path, relationship_types=None):
+    """Read the text lines of relationships, optionally of the given types"""
+    relationships = read_csv_as_dataframe(relationships_path)
+    texts = []
+    for relationship in relationships.to_dict(orient="records"):
+        if relationship_types and (
+            relationship["relationship_type"] not in relationship_types
+        ):
+            continue
+        try:
+            texts.extend(eval_string_as_list(relationship["text"]))
+        except (ValueError, SyntaxError):
+            texts.append(str(relationship["text"]))
+    return texts
+
+
+############################################################################
+# text cleanup, as implemented before the patterns were compiled once
+def legacy_clean_up_significant_control(text):
+    """clean_up_significant_control, building its pattern per call"""
+    regex_pattern = ""
+    for item in IN_PARENTHESIS:
+        regex_pattern += r"\(.*{}.*\)|".format(item)
+    regex_pattern = "({})".format(regex_pattern[:-1])
+
+    match = re.search(regex_pattern, text)
+    if match:
+        groups = match.groups()
+        for grp in groups:
+            text = text.replace(grp, "")
+
+    return text.strip()
+
+
+def legacy_strip_positions_text(text):
+    """strip_positions_text, building its pattern per call"""
+    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
+    text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+    return text
+
+
+def legacy_clean_up_directorship(text):
+    """clean_up_directorship, building its pattern per call"""
+    text = strip_category_text(text)
+
+    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
+    text = re.sub(pattern, "", text)
+
+    parenthesis_match = find_text_within_parenthesis_excluding_other_parenthesis(text)
+    if parenthesis_match:
+        for match in parenthesis_match:
+            if not has_consecutive_capital_letters_within_parenthesis(match):
+                text = text.replace(match, "")
+
+    splitters = ["trading as ", "investee companies", ";"]
+    for splitter in splitters:
+        if splitter in text:
+            text = text.split(splitter)[0]
+
+    starters = ["and ", ", ", "of "]
+    for starter in starters:
+        if text.startswith(starter):
+            text = text[len(starter) :]
+
+    text = text.replace("  ", " ")
+    return text.strip()
+
+
+def legacy_positions_sub(text):
+    """The positions substitution of clean_up_shareholder, building it per call"""
+    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
+    return re.sub(pattern, "", text)
+
+
+def benchmark_text_cleanup(relationships_path, logger, repeat=3):
+    """
+    Time the text cleanup helpers against their per call pattern building
+    predecessors on real relationship texts, checking the results agree
+    """
+    texts = read_relationship_texts(relationships_path)
+    logger.info("Benchmarking text cleanup on {} texts".format(len(texts)))
+
+    cases = [
+        (
+            "clean_up_significant_control",
+            legacy_clean_up_significant_control,
+            clean_up_significant_control,
+        ),
+        ("strip_positions_text", legacy_strip_positions_text, strip_positions_text),
+        (
+            "clean_up_directorship",
+            legacy_clean_up_directorship,
+            clean_up_directorship,
+        ),
+        (
+            "positions substitution",
+            legacy_positions_sub,
+            lambda text: POSITIONS_REGEX.sub("", text),
+        ),
+    ]
+
+    results = []
+    for (name, legacy, current) in cases:
+        mismatches = sum(1 for text in texts if legacy(text) != current(text))
+        legacy_time = time_calls(legacy, texts, repeat)
+        current_time = time_calls(current, texts, repeat)
+        results.append((name, legacy_time, current_time, mismatches))
+        logger.info(
+            "{}: {:.2f}us -> {:.2f}us per call ({:.1f}x), {} mismatches".format(
+                name,
+                legacy_time / len(texts) * 1e6,
+                current_time / len(texts) * 1e6,
+                legacy_time / current_time if current_time else 0.0,
+                mismatches,
+            )
+        )
+    return results
+
+
+############################################################################
+# graph loading
+def benchmark_graph_schema(graphdb, logger):
+    """Time a full graph load without, then with, the name constraints and indexes"""
+    entities = read_csv_as_dataframe(graphdb.entities)
+    labels = graphdb.schema_labels(entities["entity_type"])
+
+    graphdb.drop_schema(labels)
+    graphdb.schema = False
+    without_schema = time_call(graphdb.execute)
+
+    graphdb.schema = True
+    with_schema = time_call(graphdb.execute)
+
+    logger.info(
+        "Graph load: {:.2f}s without schema, {:.2f}s with schema ({:.1f}x)".format(
+            without_schema,
+            with_schema,
+            without_schema / with_schema if with_schema else 0.0,
+        )
+    )
+    return (without_schema, with_schema)
+
+
+def benchmark_graph_load(entities_path, relationships_path, logger, repeat=3):
+    """
+    Time a full graph load into the in memory backend, checking the merged
+    node and created relationship counts against the prepared rows
+    """
+    graphdb = GraphDB(
+        host=None,
+        port=None,
+        user=None,
+        password=None,
+        entities=entities_path,
+        relationships=relationships_path,
+        logger=logger,
+        backend="memory",
+    )
+    (nodes, graph_relationships) = graphdb.prepare(
+        read_csv_as_dataframe(entities_path),
+        read_csv_as_dataframe(relationships_path),
+    )
+    expected_nodes = sum(len(properties) for properties in nodes.values())
+    expected_relationships = sum(len(rows) for rows in graph_relationships.values())
+
+    best = None
+    for _ in range(repeat):
+        taken = time_call(graphdb.execute)
+        best = taken if best is None else min(best, taken)
+
+    sink = graphdb.sink
+    rows = expected_nodes + expected_relationships
+    logger.info(
+        "Memory graph load: {} rows in {:.2f}s ({:.0f} rows/sec)".format(
+            rows, best, rows / best if best else 0.0
+        )
+    )
+    logger.info(
+        "Nodes: {} prepared, {} merged. Relationships: {} prepared, {} created".format(
+            expected_nodes,
+            len(sink.nodes),
+            expected_relationships,
+            len(sink.relationships),
+        )
+    )
+    sink.log(logger)
+    return (best, len(sink.nodes), len(sink.relationships))
+
+
+############################################################################
+# conversion memory
+class LoadedConvert(Convert):
+    """Convert reading the whole members document up front, as before streaming"""
+
+    def __init__(self, *args, **kwargs):
+        """Initialise the converter, loading the members document"""
+        super().__init__(*args, **kwargs)
+        self._members_data = read_json_file(self.members_path)
+
+    def iter_members(self, house):
+        """Iterate the loaded members of a house"""
+        return iter(self._members_data[house])
+
+
+def peak_rss():
+    """Peak resident set size of this process, in megabytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_convert(mode, members_path, output_dir):
+    """Convert the members without spads, returning the peak rss"""
+    logger = logging.getLogger("convert")
+    if mode == "stream":
+        Convert(members_path, None, output_dir, logger).execute()
+    elif mode == "load":
+        LoadedConvert(members_path, None, output_dir, logger).execute()
+    return peak_rss()
+
+
+def benchmark_convert_memory(members_path, logger):
+    """
+    Peak rss of converting the members streamed and loaded up front, each in
+    its own subprocess, against the baseline of the imports alone
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path = os.environ.get("PYTHONPATH")
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([package_dir, python_path])
+        if python_path
+        else package_dir,
+    )
+
+    results = {}
+    for mode in ["baseline", "load", "stream"]:
+        with tempfile.TemporaryDirectory() as output_dir:
+            time_start = time.perf_counter()
+            command = [sys.executable, "-c", CONVERT_RSS_SCRIPT, mode]
+            process = subprocess.run(
+                command + [members_path, output_dir],
+                env=env,
+                stdout=subprocess.PIPE,
+                check=True,
+            )
+            taken = time.perf_counter() - time_start
+        results[mode] = float(process.stdout.decode().strip().splitlines()[-1])
+        logger.info(
+            "Convert {}: {:.1f}MB peak rss ({:.2f}s)".format(
+                mode, results[mode], taken
+            )
+        )
+
+    logger.info(
+        "Convert members above baseline: {:.1f}MB loaded, {:.1f}MB streamed".format(
+            results["load"] - results["baseline"],
+            results["stream"] - results["baseline"],
+        )
+    )
+    return results
+
+
+############################################################################
+# register of interests html
+def legacy_parse_regmem_html(html):
+    """parse_regmem_html, as the BeautifulSoup loop it replaced"""
+    results = []
+    soup = BeautifulSoup(html, features="lxml")
+    for div in soup.find_all("div"):
+        if "regmemcategory" in div.attrs["class"]:
+            results.append(("regmemcategory", div.text))
+        elif "regmemitem" in div.attrs["class"]:
+            delimeter = "?????"
+            for line_break in div.findAll("br"):
+                line_break.replaceWith(delimeter)
+            texts = re.sub("\r|\n", " ", div.get_text()).split(delimeter)
+            results.append(("regmemitem", texts))
+        else:
+            results.append((None, str(div)))
+    return results
+
+
+def benchmark_regmem_parsers(members_path, logger, repeat=3):
+    """
+    Time the lxml register of interests parser against the BeautifulSoup
+    one on every commons member's html, checking the results agree
+    """
+    htmls = [
+        member["Interests"]
+        for member in iter_json_items(members_path, "commons.item")
+        if member.get("Interests")
+    ]
+    logger.info("Benchmarking regmem parsers on {} members".format(len(htmls)))
+
+    def current(html):
+        return list(parse_regmem_html(html))
+
+    def known(results):
+        return [result for result in results if result[0]]
+
+    mismatches = sum(
+        1
+        for html in htmls
+        if known(legacy_parse_regmem_html(html)) != known(current(html))
+    )
+    legacy_time = time_calls(legacy_parse_regmem_html, htmls, repeat)
+    current_time = time_calls(current, htmls, repeat)
+    logger.info(
+        "parse_regmem_html: {:.2f}ms -> {:.2f}ms per member ({:.1f}x), "
+        "{} mismatches".format(
+            legacy_time / len(htmls) * 1e3,
+            current_time / len(htmls) * 1e3,
+            legacy_time / current_time if current_time else 0.0,
+            mismatches,
+        )
+    )
+    return (legacy_time, current_time, mismatches)
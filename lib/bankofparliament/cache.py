@@ -0,0 +1,193 @@
+"""
+Module for caching reconcile responses on disk
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# local libs
+from .constants import (
+    RECONCILE_CACHE_TTL,
+    RECONCILE_CACHE_NEGATIVE_TTL,
+    RECONCILE_CACHE_MAX_ENTRIES,
+)
+
+
+class ReconcileCache:
+    """Sqlite backed response cache, with expiry and least recently used eviction"""
+
+    MISSING = object()
+
+    def __init__(
+        self,
+        path,
+        logger,
+        ttl=RECONCILE_CACHE_TTL,
+        negative_ttl=RECONCILE_CACHE_NEGATIVE_TTL,
+        max_entries=RECONCILE_CACHE_MAX_ENTRIES,
+    ):
+        """Open, or create, the cache database"""
+        self.path = path
+        self.logger = logger
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.count = 0
+
+        # access times of hits, written with the next store or on close
+        self._accessed = {}
+
+        dirname = os.path.dirname(path)
+        if path != ":memory:" and dirname and not os.path.exists(dirname):
+            self.logger.debug("Making directoy: {}".format(dirname))
+            os.makedirs(dirname, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "endpoint TEXT, "
+            "query TEXT, "
+            "response TEXT, "
+            "expires REAL, "
+            "accessed REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.evict()
+        self.connection.commit()
+
+    @staticmethod
+    def normalise_query(query):
+        """Normalise a query string so trivially different queries share a key"""
+        return re.sub(r"\s+", " ", str(query)).strip().lower()
+
+    def make_key(self, endpoint, query, params=None):
+        """Key for an (endpoint, normalised query, params) triple"""
+        data = json.dumps(
+            [endpoint, self.normalise_query(query), params or {}],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, query, params=None):
+        """Get a cached response, or ReconcileCache.MISSING"""
+        key = self.make_key(endpoint, query, params)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or row[1] < now:
+                self.misses += 1
+                return self.MISSING
+
+            self.hits += 1
+            self._accessed[key] = now
+        return json.loads(row[0])
+
+    def set(self, endpoint, query, response, params=None):
+        """Store a response, empty responses expire after the negative ttl"""
+        key = self.make_key(endpoint, query, params)
+        now = time.time()
+        ttl = self.ttl if response else self.negative_ttl
+
+        with self.lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    endpoint,
+                    self.normalise_query(query),
+                    json.dumps(response),
+                    now + ttl,
+                    now,
+                ),
+            )
+            self.stores += 1
+            if not exists:
+                self.count += 1
+            self.flush_accessed()
+            if self.count > self.max_entries:
+                self.evict()
+            self.connection.commit()
+
+    def flush_accessed(self):
+        """Write the pending access times of hits"""
+        if self._accessed:
+            self.connection.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for (key, accessed) in self._accessed.items()],
+            )
+            self._accessed = {}
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones above the size cap"""
+        self.connection.execute(
+            "DELETE FROM responses WHERE expires < ?", (time.time(),)
+        )
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            excess = count - self.max_entries
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+            count = self.max_entries
+        self.count = count
+
+    def fetch(self, endpoint, query, fetch_function, params=None):
+        """
+        Get a cached response, or call fetch_function and cache its result.
+        Failed requests, where fetch_function returns None, are not cached
+        """
+        response = self.get(endpoint, query, params)
+        if response is self.MISSING:
+            response = fetch_function()
+            if response is not None:
+                self.set(endpoint, query, response, params)
+        return response
+
+    def log_stats(self):
+        """Log the hit and miss counters"""
+        lookups = self.hits + self.misses
+        self.logger.info(
+            "Reconcile cache: {} hits, {} misses ({:.2f}%), {} evictions".format(
+                self.hits,
+                self.misses,
+                float(self.hits / lookups * 100) if lookups else 0.0,
+                self.evictions,
+            )
+        )
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.flush_accessed()
+            self.evict()
+            self.connection.commit()
+            self.connection.close()
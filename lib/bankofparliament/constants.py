@@ -5,12 +5,36 @@ Constants
 
 # Named entityy recognition
 NER_BASE_MODEL = "en_core_web_md"
+NLP_BATCH_SIZE = 256
 
 # Neo4j
 NEO4J_URL = "bolt://{}:{}"
+GRAPHDB_BATCH_SIZE = 1000
+GRAPHDB_DELETE_BATCH_SIZE = 10000
+GRAPHDB_TOP_COUNTERPARTIES = 5
 
 # Download / query constants
-REQUEST_WAIT_TIME = 300
+REQUEST_WAIT_TIME = 300  # longest backoff between retries
+REQUEST_BACKOFF_BASE = 2
+REQUEST_MAX_RETRIES = 6
+
+# Reconcile cache, times in seconds
+RECONCILE_CACHE_TTL = 60 * 60 * 24 * 90
+RECONCILE_CACHE_NEGATIVE_TTL = 60 * 60 * 24 * 14
+RECONCILE_CACHE_MAX_ENTRIES = 250000
+
+# Pdf tables, read with tabula and cached as feather files under the data
+# cache directory, relative to the package
+PDF_TABLE_OPTIONS = {"pages": "all", "multiple_tables": True}
+PDF_TABLE_CACHE_DIR = "../../data/cache/pdf_tables"
+
+# Per host request limits, (concurrent requests or burst, requests per second)
+DEFAULT_HOST_LIMITS = (1, 1.0)
+RECONCILE_HOST_LIMITS = {
+    "opencorporates.com": (2, 1.0),
+    "findthatcharity.uk": (4, 4.0),
+    "api.companieshouse.gov.uk": (4, 2.0),  # 600 requests per 5 minutes
+}
 HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
 
 # uk government
@@ -31,6 +55,9 @@ OPENCORPORATES_RECONCILE_FLYOUT_URL = "https://opencorporates.com/reconcile/flyo
 # findthatcharity
 FINDTHATCHARITY_RECONCILE_URL = "https://findthatcharity.uk/reconcile/{}"
 
+# number of names sent per batched reconcile request, as queries q0..qN
+RECONCILE_BATCH_SIZE = 10
+
 # companies house
 QUERY_LIMIT = 5
 COMPANIES_HOUSE_QUERY_URL = "https://api.companieshouse.gov.uk/{}/{}"
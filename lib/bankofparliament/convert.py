@@ -6,10 +6,13 @@ Module for convert related tasks
 # sys libs
 import os
 import re
+import collections
+from concurrent.futures import ProcessPoolExecutor
 
 # third party libs
 import pandas
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml.etree import ParserError
 
 # local libs
 from .constants import (
@@ -21,26 +24,46 @@ from .constants import (
 )
 from .custom import SwapValue
 from .utils import (
-    read_json_file,
+    iter_json_items,
     read_pdf_table,
     make_entity_dict,
     make_relationship_dict,
 )
 
+REGMEM_LINE_BREAK = "?????"
+LINE_ENDING_REGEX = re.compile("\r|\n")
+
 
 class Convert:
     """Converts serialised json and pdf data to entity and relationship csv data"""
 
     MINIMUM_SOUP_LENGTH = 3
     LOBBYISTS_REGMEM_INDEX = "10"
-
-    def __init__(self, members_path, spads_path, output_dir, logger):
+    HOUSES = ["commons", "lords"]
+    WORKER_QUEUE_FACTOR = 4
+
+    # member fields needed after a member's own conversion, kept for every member
+    MEMBER_INDEX_KEYS = [
+        "DisplayAs",
+        "Party",
+        "LayingMinisterName",
+        "GovernmentPosts",
+    ]
+
+    def __init__(
+        self, members_path, spads_path, output_dir, logger, workers=1, pdf_cache=True
+    ):
         """Initialise the converter instance"""
         self.output_dir = output_dir
         self.logger = logger
-
-        self._members_data = read_json_file(members_path)
-        self._spads_data = read_pdf_table(spads_path)
+        self.workers = workers
+
+        # members are streamed from the file, never held all at once
+        self.members_path = members_path
+        self._members_index = None
+        self._government_posts = None
+        self._spad_employers = {}
+        self._spads_data = read_pdf_table(spads_path, cache=pdf_cache, logger=logger)
         self.swap_value = SwapValue(self.logger)
 
         self._entities = []
@@ -70,11 +93,23 @@ class Convert:
 
     @property
     def members(self):
-        return self._members_data["commons"] + self._members_data["lords"]
+        for house in self.HOUSES:
+            for member in self.iter_members(house):
+                yield member
 
     @property
-    def members_data(self):
-        return self._members_data
+    def members_index(self):
+        """Index fields of every member, read in one streaming pass"""
+        if self._members_index is None:
+            self._members_index = [
+                {key: member[key] for key in self.MEMBER_INDEX_KEYS if key in member}
+                for member in self.members
+            ]
+        return self._members_index
+
+    def iter_members(self, house):
+        """Stream the members of a house"""
+        return iter_json_items(self.members_path, "{}.item".format(house))
 
     def add_entity(self, **kwargs):
         """Add entity data"""
@@ -123,7 +158,7 @@ class Convert:
 
     def add_parties(self):
         """Add all parties to entities"""
-        for member in self.members:
+        for member in self.members_index:
             party = self.cleanup_party_affliation(member["Party"]["#text"])
             _aliases = [party]
             if len(member["Party"]["#text"].split()) > 1:
@@ -136,96 +171,130 @@ class Convert:
 
     def convert_commons_members_interests(self):
         """Convert the register of interests to dict items ready for csv export"""
+        if self.workers > 1:
+            self.convert_commons_members_interests_parallel()
+            return
 
-        for member in self.members_data["commons"]:
+        for member in self.iter_members("commons"):
             self.logger.info(member["DisplayAs"])
-            self.add_member_entity(member)
+            self.convert_commons_member(member)
+
+    def convert_commons_members_interests_parallel(self):
+        """
+        Convert the commons members in a pool of worker processes, merging
+        their entities and relationships in member order, as the serial run
+        """
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_convert_worker,
+            initargs=(self.logger,),
+        ) as executor:
+            # a bounded window of members in flight, the rest stay streamed
+            pending = collections.deque()
+            for member in self.iter_members("commons"):
+                future = executor.submit(convert_commons_member, member)
+                pending.append((member["DisplayAs"], future))
+                if len(pending) >= self.workers * self.WORKER_QUEUE_FACTOR:
+                    self.merge_converted(*pending.popleft())
+
+            while pending:
+                self.merge_converted(*pending.popleft())
+
+    def merge_converted(self, name, future):
+        """Add a worker's converted member entities and relationships"""
+        (entities, relationships) = future.result()
+        self.logger.info(name)
+        self._entities.extend(entities)
+        self._relationships.extend(relationships)
+
+    def clear(self):
+        """Clear the converted entities and relationships"""
+        self._entities = []
+        self._relationships = []
 
-            # member to party relationship
-            self.add_relationship(
-                relationship_type="member_of",
-                source=member["DisplayAs"],
-                target=self.cleanup_party_affliation(member["Party"]["#text"]),
-                text=["{} membership".format(member["Party"]["#text"])],
-                link=DATA_PARLIAMENT_LINK_URL.format(member["@Member_Id"], "contact"),
-            )
+    def convert_commons_member(self, member):
+        """Convert a commons member and their register of interests"""
+        self.add_member_entity(member)
+
+        # member to party relationship
+        self.add_relationship(
+            relationship_type="member_of",
+            source=member["DisplayAs"],
+            target=self.cleanup_party_affliation(member["Party"]["#text"]),
+            text=["{} membership".format(member["Party"]["#text"])],
+            link=DATA_PARLIAMENT_LINK_URL.format(member["@Member_Id"], "contact"),
+        )
 
-            # house of commons membership
-            self.add_relationship(
-                relationship_type="employed_by",
-                source=member["DisplayAs"],
-                target="House of Commons",
-                text=["Member of the House of Commons. Salary: £{}".format(self.get_house_of_commons_salary())],
-                link=DATA_PARLIAMENT_LINK_URL.format(member["@Member_Id"], "contact"),
-                amount=self.get_house_of_commons_salary(),
-            )
+        # house of commons membership
+        self.add_relationship(
+            relationship_type="employed_by",
+            source=member["DisplayAs"],
+            target="House of Commons",
+            text=["Member of the House of Commons. Salary: £{}".format(self.get_house_of_commons_salary())],
+            link=DATA_PARLIAMENT_LINK_URL.format(member["@Member_Id"], "contact"),
+            amount=self.get_house_of_commons_salary(),
+        )
 
-            # government relationship
-            self.add_government_relationship(member)
+        # government relationship
+        self.add_government_relationship(member)
 
-            # financial interests relationships
-            soup = BeautifulSoup(member["Interests"], features="lxml")
-            last_category = None
-            last_index = None
-
-            for div in soup.find_all("div"):
-                if "regmemcategory" in div.attrs["class"]:
-                    for index in COMMONS_CATEGORIES:
-                        if div.text.startswith(str(index)):
-                            last_category = COMMONS_CATEGORIES[index]
-                            last_index = index
-
-                elif "regmemitem" in div.attrs["class"]:
-                    delimeter = "?????"
-                    for line_break in div.findAll("br"):
-                        line_break.replaceWith(delimeter)
-                    _texts = re.sub("\r|\n", " ", div.get_text()).split(delimeter)
-
-                    texts = [
-                        text for text in _texts if len(text) > self.MINIMUM_SOUP_LENGTH
-                    ]
-
-                    if texts:
-                        self.add_relationship(
-                            relationship_type=last_category,
-                            source=member["DisplayAs"],
-                            target="UNKNOWN",
-                            text=texts,
-                            link=THEYWORKFORYOU_LINK_URL.format(
-                                member["DisplayAs"].lower().replace(" ", "_"),
-                                member["MemberFrom"].lower().replace(" ", "_"),
-                            ),
-                        )
+        # financial interests relationships
+        last_category = None
+        last_index = None
 
-                    if last_category == "related_to":
-                        # relations are either emplyed by the member or are
-                        # employed as a lobbyist
-                        if last_index == self.LOBBYISTS_REGMEM_INDEX:
-                            _target = "UNKNOWN"
-                            _text = texts
-                        else:
-                            _target = member["DisplayAs"]
-                            _text = ["Am employed by {}".format(member["DisplayAs"])]
-
-                        # we have member > related_to > person
-                        # add secondary employment relationship
-                        self.add_relationship(
-                            relationship_type="employed_by",
-                            source="UNKNOWN",
-                            target=_target,
-                            text=_text,
-                            link=THEYWORKFORYOU_LINK_URL.format(
-                                member["DisplayAs"].lower().replace(" ", "_"),
-                                member["MemberFrom"].lower().replace(" ", "_"),
-                            ),
-                        )
-                else:
-                    self.logger.warning("Unrecognised div class: {}".format(div))
+        for (div_class, content) in parse_regmem_html(member["Interests"]):
+            if div_class == "regmemcategory":
+                for index in COMMONS_CATEGORIES:
+                    if content.startswith(str(index)):
+                        last_category = COMMONS_CATEGORIES[index]
+                        last_index = index
+
+            elif div_class == "regmemitem":
+                texts = [
+                    text for text in content if len(text) > self.MINIMUM_SOUP_LENGTH
+                ]
+
+                if texts:
+                    self.add_relationship(
+                        relationship_type=last_category,
+                        source=member["DisplayAs"],
+                        target="UNKNOWN",
+                        text=texts,
+                        link=THEYWORKFORYOU_LINK_URL.format(
+                            member["DisplayAs"].lower().replace(" ", "_"),
+                            member["MemberFrom"].lower().replace(" ", "_"),
+                        ),
+                    )
+
+                if last_category == "related_to":
+                    # relations are either emplyed by the member or are
+                    # employed as a lobbyist
+                    if last_index == self.LOBBYISTS_REGMEM_INDEX:
+                        _target = "UNKNOWN"
+                        _text = texts
+                    else:
+                        _target = member["DisplayAs"]
+                        _text = ["Am employed by {}".format(member["DisplayAs"])]
+
+                    # we have member > related_to > person
+                    # add secondary employment relationship
+                    self.add_relationship(
+                        relationship_type="employed_by",
+                        source="UNKNOWN",
+                        target=_target,
+                        text=_text,
+                        link=THEYWORKFORYOU_LINK_URL.format(
+                            member["DisplayAs"].lower().replace(" ", "_"),
+                            member["MemberFrom"].lower().replace(" ", "_"),
+                        ),
+                    )
+            else:
+                self.logger.warning("Unrecognised div class: {}".format(content))
 
     def convert_lords_members_interests(self):
         """Convert the register of interests to dict items ready for csv export"""
 
-        for member in self.members_data["lords"]:
+        for member in self.iter_members("lords"):
             self.logger.info(member["DisplayAs"])
             self.add_member_entity(member)
 
@@ -336,70 +405,31 @@ class Convert:
                         link=SPADS_URL,
                     )
 
+    @property
+    def government_posts(self):
+        """Active government posts of all members, indexed once per run"""
+        if self._government_posts is None:
+            self._government_posts = GovernmentPostIndex(self.members_index)
+        return self._government_posts
+
     def get_spad_employer(self, government_position):
         """Convert a government position to a member name"""
+        if government_position not in self._spad_employers:
+            self._spad_employers[
+                government_position
+            ] = self._get_member_from_laying_minister_name(government_position)
+        return self._spad_employers[government_position]
 
-        def _get_government_posts():
-            """Find all governments posts currently active"""
-            government_posts = []
-            for member in self.members_data["commons"] + self.members_data["lords"]:
-                if member.get("GovernmentPosts", None) or []:
-                    posts = member["GovernmentPosts"]["GovernmentPost"]
-                    if isinstance(posts, dict):
-                        posts = [posts]
-
-                    for post in posts:
-                        if not post["EndDate"]:
-                            government_posts.append((post, member["DisplayAs"]))
-
-            return government_posts
-
-        government_posts = _get_government_posts()
-        spad_employer = self._get_member_from_laying_minister_name(
-            government_position, government_posts
-        )
-        return spad_employer
-
-    def _get_member_from_laying_minister_name(
-        self, laying_minister_name, government_posts
-    ):
+    def _get_member_from_laying_minister_name(self, laying_minister_name):
         """Resolve a laying minister name to an entity"""
         # there are some names here, that don't correspond exactly to laying
         # ministers names, let's check our custom values first
         laying_minister_name = self.swap_value.swap(laying_minister_name)
 
-        def _loop_members():
-            """Members generator"""
-            for member in self.members:
-                yield member
-
-        for member in _loop_members():
-            if laying_minister_name == member.get("LayingMinisterName", None):
-                self.logger.debug(
-                    "Found laying minister: {}".format(member["DisplayAs"])
-                )
-                return member["DisplayAs"]
-
-        for (post, member) in government_posts:
-            name = post.get("Name", None)
-            hansard_name = post.get("HansardName", None)
-            laying_name = post.get("LayingMinisterName", None)
-
-            if laying_minister_name in [name, hansard_name, laying_name]:
-                self.logger.debug("Found laying minister: {}".format(member))
-                return member
-
-            if name and laying_minister_name in name:
-                self.logger.debug("Found laying minister: {}".format(member))
-                return member
-
-            if hansard_name and laying_minister_name in hansard_name:
-                self.logger.debug("Found laying minister: {}".format(member))
-                return member
-
-            if laying_name and laying_minister_name in laying_name:
-                self.logger.debug("Found laying minister: {}".format(member))
-                return member
+        member = self.government_posts.find(laying_minister_name)
+        if member:
+            self.logger.debug("Found laying minister: {}".format(member))
+            return member
 
         self.logger.warning(
             "Could not find laying minister: {}".format(laying_minister_name)
@@ -409,27 +439,17 @@ class Convert:
     def add_government_relationship(self, member):
         """If the member has a government post, add a relationship"""
         # government relationship
-        if member.get("GovernmentPosts", None) or []:
-            posts = member["GovernmentPosts"]["GovernmentPost"]
-            if isinstance(posts, dict):
-                posts = [posts]
-
-            for post in posts:
-                if not post["EndDate"]:
-                    self.add_relationship(
-                        source=member["DisplayAs"],
-                        relationship_type="employed_by",
-                        target="Her Majesty's Government",
-                        text=[
-                            "Employed as {} for Her Majesty's Government".format(
-                                post["Name"]
-                            )
-                        ],
-                        amount=self.get_government_salary(post),
-                        link=DATA_PARLIAMENT_LINK_URL.format(
-                            member["@Member_Id"], "contact"
-                        ),
-                    )
+        for post in get_active_government_posts(member):
+            self.add_relationship(
+                source=member["DisplayAs"],
+                relationship_type="employed_by",
+                target="Her Majesty's Government",
+                text=[
+                    "Employed as {} for Her Majesty's Government".format(post["Name"])
+                ],
+                amount=self.get_government_salary(post),
+                link=DATA_PARLIAMENT_LINK_URL.format(member["@Member_Id"], "contact"),
+            )
 
         # now committees? TODO
 
@@ -585,3 +605,155 @@ class Convert:
         entities_dataframe.to_csv(entities_csv, index_label="id")
 
         self.logger.info("Saved: {}".format((output_dir)))
+
+
+def get_active_government_posts(member):
+    """The government posts of a member without an end date"""
+    if not member.get("GovernmentPosts", None):
+        return []
+
+    posts = member["GovernmentPosts"]["GovernmentPost"]
+    if isinstance(posts, dict):
+        posts = [posts]
+    return [post for post in posts if not post["EndDate"]]
+
+
+class GovernmentPostIndex:
+    """
+    Active government posts of members, in member order, indexed for
+    laying minister name lookups. A name resolves to the member with that
+    laying minister name, else to the member of the first post having the
+    name as, or within, its name, hansard name or laying minister name
+    """
+
+    POST_FIELDS = ["Name", "HansardName", "LayingMinisterName"]
+    NGRAM_SIZE = 3
+
+    def __init__(self, members):
+        """Index the members' laying minister names and active posts"""
+        self.laying_ministers = {}
+        self.posts = []
+        self.exact = {}
+        self.ngrams = {}
+
+        for member in members:
+            laying_minister_name = member.get("LayingMinisterName", None)
+            if isinstance(laying_minister_name, str):
+                self.laying_ministers.setdefault(
+                    laying_minister_name, member["DisplayAs"]
+                )
+
+            for post in get_active_government_posts(member):
+                position = len(self.posts)
+                # missing names may be nil objects, only text is matched
+                values = [post.get(field, None) for field in self.POST_FIELDS]
+                values = [value for value in values if isinstance(value, str)]
+                self.posts.append((values, member["DisplayAs"]))
+
+                for value in values:
+                    self.exact.setdefault(value, position)
+                    for ngram in self.get_ngrams(value):
+                        self.ngrams.setdefault(ngram, set()).add(position)
+
+    def get_ngrams(self, text):
+        """Distinct character ngrams of a text"""
+        return {
+            text[start : start + self.NGRAM_SIZE]
+            for start in range(len(text) - self.NGRAM_SIZE + 1)
+        }
+
+    def get_candidates(self, name):
+        """Positions of the posts that may contain name, in order"""
+        if len(name) < self.NGRAM_SIZE:
+            return range(len(self.posts))
+
+        postings = sorted(
+            (self.ngrams.get(ngram, set()) for ngram in self.get_ngrams(name)),
+            key=len,
+        )
+        return sorted(set.intersection(*postings))
+
+    def find(self, name):
+        """Member of a laying minister name, or None"""
+        if name in self.laying_ministers:
+            return self.laying_ministers[name]
+
+        # an exact match bounds the search, an earlier post may contain name
+        position = self.exact.get(name, None)
+        for candidate in self.get_candidates(name):
+            if position is not None and candidate >= position:
+                break
+            (values, _member) = self.posts[candidate]
+            if any(value and name in value for value in values):
+                position = candidate
+                break
+
+        if position is None:
+            return None
+        return self.posts[position][1]
+
+
+def element_text(element, line_break=None):
+    """
+    Text of an element and its descendants, excluding comments as
+    BeautifulSoup get_text does, with any <br> replaced by line_break
+    """
+    parts = []
+    add_element_text(element, parts, line_break)
+    return "".join(parts)
+
+
+def add_element_text(element, parts, line_break):
+    """Add the text of an element's subtree to parts, in document order"""
+    if not isinstance(element.tag, str):
+        return
+
+    if line_break is not None and element.tag == "br":
+        parts.append(line_break)
+        return
+
+    if element.text:
+        parts.append(element.text)
+    for child in element:
+        add_element_text(child, parts, line_break)
+        if child.tail:
+            parts.append(child.tail)
+
+
+def parse_regmem_html(html):
+    """
+    Parse the register of interests html of a commons member, yielding
+    ("regmemcategory", text) and ("regmemitem", texts split at line breaks)
+    for each div in document order, or (None, html) for other divs
+    """
+    try:
+        root = lxml.html.document_fromstring(html)
+    except ParserError:
+        return
+
+    for div in root.iter("div"):
+        classes = div.get("class", "").split()
+        if "regmemcategory" in classes:
+            yield ("regmemcategory", element_text(div))
+        elif "regmemitem" in classes:
+            text = LINE_ENDING_REGEX.sub(" ", element_text(div, REGMEM_LINE_BREAK))
+            yield ("regmemitem", text.split(REGMEM_LINE_BREAK))
+        else:
+            yield (None, lxml.html.tostring(div, encoding="unicode"))
+
+
+# converter of each worker process, see init_convert_worker
+WORKER_CONVERTER = None
+
+
+def init_convert_worker(logger):
+    """Create the worker process's converter, it needs no input files"""
+    global WORKER_CONVERTER
+    WORKER_CONVERTER = Convert(None, None, None, logger)
+
+
+def convert_commons_member(member):
+    """Worker task converting a commons member, returning its converted rows"""
+    WORKER_CONVERTER.clear()
+    WORKER_CONVERTER.convert_commons_member(member)
+    return (WORKER_CONVERTER.entities, WORKER_CONVERTER.relationships)
@@ -7,6 +7,7 @@ Module for extracting entities from relationship text
 import os
 import time
 import shutil
+import asyncio
 
 # third party
 import pandas
@@ -18,11 +19,29 @@ from .utils import (
     colorize,
     make_entity_dict,
     make_relationship_dict,
+    match_findthatcharity_results,
+    match_opencorporates_results,
+    reconcile_findthatcharity_entities_by_name,
+    reconcile_opencorporates_entities_by_name,
     reconcile_opencorporates_entity_by_id,
     reconcile_findthatcharity_entity_by_id,
+    search_companies_house,
+    set_reconcile_cache,
+)
+from . import ratelimit
+from .cache import ReconcileCache
+from .constants import NER_BASE_MODEL, NLP_BATCH_SIZE, RECONCILE_BATCH_SIZE
+from .nlp import NlpCache
+from .registry import EntityRegistry, RelationshipBuffer
+from .incremental import PreviousExtraction
+from .aio import (
+    AsyncReconcileClient,
+    reconcile_findthatcharity_entities_by_name_async,
+    reconcile_opencorporates_entities_by_name_async,
+    search_companies_house_async,
 )
-from .constants import NER_BASE_MODEL
 from .relationships.base import get_relationship_solver
+from .text import eval_string_as_list
 
 
 class NamedEntityExtract:
@@ -31,6 +50,12 @@ class NamedEntityExtract:
     ENTITY_CSV_TEMPLATE = "{}/entities.csv"
     RELATIONSHIPS_ENTITY_CSV_TEMPLATE = "{}/relationships.csv"
 
+    # reconcile queries find_organisation_by_name sends before searching
+    ORGANISATION_QUERIES = [
+        ("findthatcharity", (("end_point", "all"),)),
+        ("opencorporates", (("jurisdiction", None),)),
+    ]
+
     def __init__(
         self,
         entities,
@@ -41,6 +66,13 @@ class NamedEntityExtract:
         from_index,
         to_index,
         logger,
+        nlp_batch_size=NLP_BATCH_SIZE,
+        nlp_n_process=1,
+        reconcile_cache_path=None,
+        prefetch=False,
+        batch=False,
+        reconcile_batch_size=RECONCILE_BATCH_SIZE,
+        previous=None,
     ):
         """Read all passed in data files"""
         self._time_start = time.time()
@@ -48,6 +80,11 @@ class NamedEntityExtract:
 
         self.prompt = prompt
         self.logger = logger
+        self.nlp_batch_size = nlp_batch_size
+        self.nlp_n_process = nlp_n_process
+        self.prefetch = prefetch
+        self.batch = batch
+        self.reconcile_batch_size = reconcile_batch_size
         self.output_dir = os.path.join(os.path.dirname(entities), "extracted")
 
         # read in data
@@ -63,46 +100,62 @@ class NamedEntityExtract:
             _custom_entities = pandas.DataFrame(columns=_entities.columns)
             self.custom_path = os.path.join(self.output_dir, "custom.csv")
 
-        # dataframes
-        self._entities = self.merge_entities(_entities, _custom_entities)
+        # entities registries, indexed by name
+        self._entities = self.merge_entities(
+            EntityRegistry.from_dataframe(_entities), _custom_entities
+        )
         self._relationships = _relationships[from_index:to_index]
 
-        # output dataframes
+        # output registries and dataframes
         self._extracted_entities = self._entities
-        self._extracted_custom_entities = _custom_entities
-        self._extracted_relationships = pandas.DataFrame(
+        self._extracted_custom_entities = EntityRegistry.from_dataframe(
+            _custom_entities
+        )
+        self._extracted_relationships = RelationshipBuffer(
             columns=self._relationships.columns
         )
 
+        # reconcile response cache, used by all reconcile and search queries
+        # prefetched responses are only held in memory without a cache file
+        if (prefetch or batch) and not reconcile_cache_path:
+            reconcile_cache_path = ":memory:"
+
+        self.reconcile_cache = None
+        if reconcile_cache_path:
+            self.logger.debug("Reconcile cache: {}".format(reconcile_cache_path))
+            self.reconcile_cache = ReconcileCache(reconcile_cache_path, self.logger)
+            set_reconcile_cache(self.reconcile_cache)
+
         # initialise nlp model
         self.logger.debug("Loading NER model: {}".format(NER_BASE_MODEL))
-        self.nlp = spacy.load(NER_BASE_MODEL)
+        self.nlp = NlpCache(spacy.load(NER_BASE_MODEL), self.logger)
+
+        # results of a previous snapshot, reused for unchanged relationships
+        self.previous = PreviousExtraction(previous, self.logger) if previous else None
+        self._reusable = {}
+        self._solvers = {}
 
         self.processed_relationships = 0
         self.resolved_relationships = 0
+        self.reused_relationships = 0
+        self.recomputed_relationships = 0
 
     def merge_entities(self, entities, new):
-        """"""
+        """Merge new entities into the registry, extending existing aliases"""
         new_entities = []
-        for (_id, new_entity) in new.iterrows():
+        for new_entity in new.to_dict(orient="records"):
 
             new_name = new_entity["name"]
             new_aliases = new_entity["aliases"].lower().split(";")
 
-            filt = entities["name"] == new_name
-            existing_entities = entities.loc[filt]
-
-            if len(existing_entities):
-                for (_i, _existing) in existing_entities.iterrows():
-                    merged = list(set(_existing["aliases"].split(";") + new_aliases))
-                    entities.loc[_i, ["aliases"]] = ";".join(merged)
+            # custom entities only extend entities of exactly the same name
+            if entities.exists(new_name, exact=True):
+                entities.merge_aliases(new_name, new_aliases, exact=True)
             else:
-                new_entities.append(new_entity.to_dict())
+                new_entities.append(new_entity)
 
-        if len(new_entities):
-            entities = pandas.concat(
-                [entities, pandas.DataFrame(new_entities)], ignore_index=True
-            )
+        for new_entity in new_entities:
+            entities.append(new_entity)
 
         return entities
 
@@ -116,9 +169,240 @@ class NamedEntityExtract:
 
     def execute(self):
         """Execute"""
+        if self.previous:
+            self.match_previous_relationships()
+        self.parse_relationship_texts()
+        if self.prefetch or self.batch:
+            self.prefetch_reconcile_queries()
         self.extract_entities_from_relationships()
         self.save()
         self.log_output()
+        if self.reconcile_cache:
+            self.reconcile_cache.close()
+
+    def match_previous_relationships(self):
+        """Find the relationships unchanged since the previous snapshot"""
+        for (index, relationship) in self.relationships.iterrows():
+            if relationship.get("resolved", "N/A") != "N/A":
+                continue
+
+            results = self.previous.get_relationships(relationship)
+            if results:
+                self._reusable[index] = results
+
+        self.logger.info(
+            "{}/{} relationships unchanged since the previous snapshot".format(
+                len(self._reusable), len(self.relationships)
+            )
+        )
+
+    def parse_relationship_texts(self):
+        """Parse every distinct unresolved relationship text with the nlp model"""
+        time_start = time.time()
+
+        texts = []
+        for (index, relationship) in self.relationships.to_dict(orient="index").items():
+            if relationship.get("resolved", "N/A") != "N/A" or index in self._reusable:
+                continue
+
+            # solvers parse both the raw text and its evaluated lines
+            texts.append(relationship["text"])
+            # malformed or non string texts are left for the solvers to parse
+            try:
+                texts.extend(eval_string_as_list(relationship["text"]))
+            except Exception:
+                pass
+
+        parsed = self.nlp.pipe(
+            texts, batch_size=self.nlp_batch_size, n_process=self.nlp_n_process
+        )
+        self.logger.info(
+            "Parsed {} relationship texts ({:.2f}s)".format(
+                parsed, time.time() - time_start
+            )
+        )
+
+    def prefetch_reconcile_queries(self):
+        """
+        Query the reconcile services for every query the solvers may request,
+        in batched requests, concurrently when prefetching, so the responses
+        are already cached when solving
+        """
+        time_start = time.time()
+
+        queries = []
+        for (index, relationship) in self.relationships.iterrows():
+            if relationship.get("resolved", "N/A") != "N/A" or index in self._reusable:
+                continue
+
+            # unknown sources are resolved from earlier results when solving
+            if relationship["source"] == "UNKNOWN":
+                continue
+
+            # solvers are kept for the solving loop, cleanup runs only once
+            solver = self.get_relationship_solver(index, relationship)
+            if solver:
+                self._solvers[index] = solver
+                queries.extend(solver.get_reconcile_queries())
+
+        # group the queries per endpoint and parameters
+        grouped = {}
+        for (endpoint, query, params) in queries:
+            if query:
+                key = (endpoint, tuple(sorted(params.items())))
+                grouped.setdefault(key, {})[query] = None
+
+        if self.prefetch:
+            failed = asyncio.run(self._prefetch_reconcile_queries(grouped))
+        else:
+            failed = self._batch_reconcile_queries(grouped)
+        self.logger.info(
+            "Prefetched {} reconcile queries, {} failed ({:.2f}s)".format(
+                sum(len(names) for names in grouped.values()),
+                failed,
+                time.time() - time_start,
+            )
+        )
+
+    async def _prefetch_reconcile_queries(self, grouped):
+        """Await the grouped reconcile queries, returns the failure count"""
+        organisations = self.add_organisation_queries(grouped)
+
+        async with AsyncReconcileClient(self.logger) as client:
+            # reconcile services accept many queries per request
+            keys = list(grouped)
+            results = await asyncio.gather(
+                *[
+                    self._prefetch_reconcile_batch(client, key, list(grouped[key]))
+                    for key in keys
+                ],
+                return_exceptions=True,
+            )
+            reconciled = dict(zip(keys, results))
+
+            # companies house search is one query per request, only send
+            # those for organisations neither reconcile service matched
+            searches = []
+            if self.companies_house_apikey:
+                searches = [
+                    search_companies_house_async(
+                        client, name, self.companies_house_apikey, self.logger
+                    )
+                    for name in self.get_unmatched_organisations(
+                        organisations, reconciled
+                    )
+                ]
+            results.extend(await asyncio.gather(*searches, return_exceptions=True))
+
+        failed = [result for result in results if isinstance(result, Exception)]
+        for error in failed:
+            self.logger.debug("Prefetch failed: {}".format(error))
+        return len(failed)
+
+    def _batch_reconcile_queries(self, grouped):
+        """Send the grouped reconcile queries in turn, returns the failure count"""
+        organisations = self.add_organisation_queries(grouped)
+
+        reconciled = {}
+        failed = 0
+        for (key, names) in grouped.items():
+            reconciled[key] = self._reconcile_batch(key, list(names))
+            failed += len(names) - len(reconciled[key])
+
+        if self.companies_house_apikey:
+            for name in self.get_unmatched_organisations(organisations, reconciled):
+                search_companies_house(name, self.companies_house_apikey, self.logger)
+        return failed
+
+    def _reconcile_batch(self, key, names):
+        """Send the batched reconcile queries for names on an endpoint"""
+        (endpoint, params) = key
+        params = dict(params)
+        if endpoint == "findthatcharity":
+            return reconcile_findthatcharity_entities_by_name(
+                names,
+                self.logger,
+                end_point=params["end_point"],
+                chunk_size=self.reconcile_batch_size,
+            )
+        return reconcile_opencorporates_entities_by_name(
+            names,
+            self.logger,
+            jurisdiction=params["jurisdiction"],
+            chunk_size=self.reconcile_batch_size,
+        )
+
+    async def _prefetch_reconcile_batch(self, client, key, names):
+        """Await the batched reconcile queries for names on an endpoint"""
+        (endpoint, params) = key
+        params = dict(params)
+        if endpoint == "findthatcharity":
+            return await reconcile_findthatcharity_entities_by_name_async(
+                client,
+                names,
+                self.logger,
+                end_point=params["end_point"],
+                chunk_size=self.reconcile_batch_size,
+            )
+        return await reconcile_opencorporates_entities_by_name_async(
+            client,
+            names,
+            self.logger,
+            jurisdiction=params["jurisdiction"],
+            chunk_size=self.reconcile_batch_size,
+        )
+
+    def add_organisation_queries(self, grouped):
+        """
+        Replace the organisation queries with the findthatcharity and
+        opencorporates queries they start with, returns the organisations
+        """
+        organisations = list(grouped.pop(("organisation", ()), {}))
+        for key in self.ORGANISATION_QUERIES:
+            grouped.setdefault(key, {}).update(dict.fromkeys(organisations))
+        return organisations
+
+    def get_unmatched_organisations(self, organisations, reconciled):
+        """Organisations reconciled without a match on either service"""
+        (findthatcharity, opencorporates) = [
+            reconciled[key] for key in self.ORGANISATION_QUERIES
+        ]
+        if isinstance(findthatcharity, Exception) or isinstance(
+            opencorporates, Exception
+        ):
+            return []
+
+        unmatched = []
+        for name in organisations:
+            # failed requests are retried when solving, before searching
+            if name not in findthatcharity or name not in opencorporates:
+                continue
+            if any(
+                match_findthatcharity_results(name, findthatcharity[name], self.logger)
+            ):
+                continue
+            if any(
+                match_opencorporates_results(name, opencorporates[name], self.logger)
+            ):
+                continue
+            unmatched.append(name)
+        return unmatched
+
+    def get_relationship_solver(self, index, relationship):
+        """Get the solver for a relationship, reusing a prefetch solver"""
+        if index in self._solvers:
+            return self._solvers.pop(index)
+
+        return get_relationship_solver(
+            index=index,
+            relationship=relationship,
+            entities=self._extracted_entities,
+            nlp=self.nlp,
+            companies_house_apikey=self.companies_house_apikey,
+            prompt=self.prompt,
+            logger=self.logger,
+            parent=self,
+        )
 
     def extract_entities_from_relationships(self):
         """Extract entities from the relationships"""
@@ -131,6 +415,10 @@ class NamedEntityExtract:
                 )
                 continue
 
+            if index in self._reusable:
+                self.relationship_reuse(index, self._reusable[index])
+                continue
+
             if (
                 relationship["source"] == "UNKNOWN"
                 and relationship["target"] == "UNKNOWN"
@@ -151,20 +439,12 @@ class NamedEntityExtract:
                     relationship["source"] = resolved_source
 
             # get the solver for the relationship type
-            solver = get_relationship_solver(
-                index=index,
-                relationship=relationship,
-                entities=self._extracted_entities,
-                nlp=self.nlp,
-                companies_house_apikey=self.companies_house_apikey,
-                prompt=self.prompt,
-                logger=self.logger,
-                parent=self,
-            )
+            solver = self.get_relationship_solver(index, relationship)
 
             # solve for entites, add any new ones found
             # for every entity, create a relationship from source
             if solver:
+                self.recomputed_relationships += 1
                 solver.solve()
 
                 # check to see if we have extracted entities, if we don't
@@ -240,10 +520,30 @@ class NamedEntityExtract:
         self.add_relationship(relationship)
         self.log_relationship(index, relationship, debug_text, resolved)
 
+    def relationship_reuse(self, index, results):
+        """Reuse the previous snapshot's results for an unchanged relationship"""
+        self.resolved_relationships += 1
+        self.reused_relationships += 1
+        for (result, entity) in results:
+            self.add_entity(entity)
+            relationship = make_relationship_dict(
+                relationship_type=result["relationship_type"],
+                source=result["source"],
+                target=result["target"],
+                date=result["date"],
+                amount=get_reused_amount(result["amount"]),
+                text=result["text"],
+                link=result["link"],
+                resolved=True,
+                recurring=str(result.get("recurring", False)) == "True",
+            )
+            self.add_relationship(relationship)
+            self.log_relationship(index, relationship, resolved=True)
+
     def get_target_from_previous_relationship(self, index):
         """"""
-        previous = self._extracted_relationships.tail(1)
-        target = str(previous["target"].item())  # this is the family member
+        previous = self._extracted_relationships.last()
+        target = str(previous["target"])  # this is the family member
         return target
 
     def get_missing_source_entity(self, relationship):
@@ -251,110 +551,57 @@ class NamedEntityExtract:
         target = relationship["target"]  # this is the member
         target_relations = self.get_sibling_relationships_by_type(target, "related_to")
 
-        for (_index, row) in target_relations.iterrows():
+        for row in target_relations:
             return row["target"]
         return None
 
     def get_sibling_relationships_by_type(self, source, relationship_type):
-        """Check if entity name already exists"""
-        filt = (
-            self._extracted_relationships["source"].str.lower() == source.lower()
-        ) & (
-            self._extracted_relationships["relationship_type"].str.lower()
-            == relationship_type.lower()
-        )
-        relationships = self._extracted_relationships.loc[filt]
-        relationships = relationships.reindex(index=relationships.index[::-1])
-        return relationships
+        """Get relationships by source and type, most recent first"""
+        return self._extracted_relationships.siblings(source, relationship_type)
 
     def add_entity(self, entity):
         """Add entity data"""
         entity_name = entity["name"]
 
         if not self.get_entity_name_exists(entity_name):
-            new_entity = pandas.DataFrame([entity])
-            self._extracted_entities = pandas.concat(
-                [self._extracted_entities, new_entity], ignore_index=True
-            )
+            self._extracted_entities.append(entity)
         else:
-            filt = self._extracted_entities["name"].str.lower() == entity_name.lower()
-            existing_entity = self._extracted_entities.loc[filt]
-
-            existing_aliases = existing_entity["aliases"].to_list()[0].split(";")
-
             new_aliases = entity["aliases"].split(";")
-            updated_aliases = list(set(existing_aliases + new_aliases))
-
-            if updated_aliases != existing_aliases:
+            if self._extracted_entities.merge_aliases(entity_name, new_aliases):
                 self.logger.debug(
                     "Updating entity [{}] aliases: {}".format(entity_name, new_aliases)
                 )
-                self._extracted_entities.loc[filt, "aliases"] = ";".join(
-                    updated_aliases
-                )
 
     def add_custom_entity(self, entity):
         """Add to custom entities"""
         entity_name = entity["name"]
         if not self.get_custom_get_entity_name_exists(entity_name):
-            new_entity = pandas.DataFrame([entity])
-            self._extracted_custom_entities = pandas.concat(
-                [self._extracted_custom_entities, new_entity], ignore_index=True
-            )
+            self._extracted_custom_entities.append(entity)
         else:
-            filt = (
-                self._extracted_custom_entities["name"].str.lower()
-                == entity_name.lower()
-            )
-            existing_entity = self._extracted_custom_entities.loc[filt]
-
-            existing_aliases = existing_entity["aliases"].to_list()[0].split(";")
-
             new_aliases = entity["aliases"].split(";")
-            updated_aliases = list(set(existing_aliases + new_aliases))
-
-            if updated_aliases != existing_aliases:
+            if self._extracted_custom_entities.merge_aliases(entity_name, new_aliases):
                 self.logger.debug(
                     "Updating custom entity [{}] aliases: {}".format(
                         entity_name, new_aliases
                     )
                 )
-                self._extracted_custom_entities.loc[filt, "aliases"] = ";".join(
-                    updated_aliases
-                )
 
     def add_relationship(self, relationship):
         """Add a new relationship"""
         relationship["target"] = relationship["target"].upper()
-        relationship = pandas.DataFrame([relationship])
-        self._extracted_relationships = pandas.concat(
-            [self._extracted_relationships, relationship], ignore_index=True
-        )
+        self._extracted_relationships.append(relationship)
 
     def get_entity_name_exists(self, name):
         """Check if entity name already exists"""
-        filt = self._extracted_entities["name"].str.lower() == name.lower()
-        entity = self._extracted_entities.loc[filt]
-        if len(entity):
-            return True
-        return False
+        return self._extracted_entities.exists(name)
 
     def get_custom_get_entity_name_exists(self, name):
         """Check if custom entity name already exists"""
-        filt = self._extracted_custom_entities["name"].str.lower() == name.lower()
-        entity = self._extracted_custom_entities.loc[filt]
-        if len(entity):
-            return True
-        return False
+        return self._extracted_custom_entities.exists(name)
 
     def get_entity_type_from_name(self, name):
         """Get the entity type from the name"""
-        filt = self._extracted_entities["name"].str.lower() == name.lower()
-        entity = self._extracted_entities.loc[filt]
-
-        if len(entity):
-            return entity.iloc[0]["entity_type"]
-        return None
+        return self._extracted_entities.get_entity_type(name)
 
     def prompt_manual_input(self, relationship, text):
         """Enter overrides for missing entities"""
@@ -471,6 +718,16 @@ class NamedEntityExtract:
                 time.strftime("%Hh%Mm%Ss", time.gmtime(taken)),
             )
         )
+        if self.previous:
+            self.logger.info(
+                "Incremental: {} relationships reused, {} recomputed".format(
+                    self.reused_relationships,
+                    self.recomputed_relationships,
+                )
+            )
+        if self.reconcile_cache:
+            self.reconcile_cache.log_stats()
+        ratelimit.metrics.log(self.logger)
 
     def backup_csv_files(self):
         """Backup existing csv files"""
@@ -499,7 +756,7 @@ class NamedEntityExtract:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-        self._extracted_relationships.to_csv(
+        self._extracted_relationships.to_dataframe().to_csv(
             self.RELATIONSHIPS_ENTITY_CSV_TEMPLATE.format(self.output_dir),
             index_label="id",
         )
@@ -509,7 +766,7 @@ class NamedEntityExtract:
             )
         )
 
-        self._extracted_entities.to_csv(
+        self._extracted_entities.to_dataframe().to_csv(
             self.ENTITY_CSV_TEMPLATE.format(self.output_dir), index_label="id"
         )
         self.logger.info(
@@ -522,8 +779,18 @@ class NamedEntityExtract:
         """Dump the rows to csv"""
         # save out dataframes
 
-        if not os.path.dirname(self.custom_path):
+        if not os.path.exists(os.path.dirname(self.custom_path)):
             os.makedirs(os.path.dirname(self.custom_path))
 
-        self._extracted_custom_entities.to_csv(self.custom_path, index_label="id")
+        self._extracted_custom_entities.to_dataframe().to_csv(
+            self.custom_path, index_label="id"
+        )
         self.logger.info("Saved Custom: {}".format(self.custom_path))
+
+
+def get_reused_amount(amount):
+    """Amount of a reused relationship, read back from csv as a float"""
+    try:
+        return int(float(amount))
+    except (TypeError, ValueError, OverflowError):
+        return None
@@ -4,21 +4,55 @@ Module for graphdb related tasks
 # -*- coding: utf-8 -*-
 
 # sys libs
+import os
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # third party libs
-from neo4j import GraphDatabase
-from neo4j.exceptions import CypherSyntaxError
+import pandas
 
 # local libs
-from .constants import NEO4J_URL
+from .constants import (
+    GRAPHDB_BATCH_SIZE,
+    GRAPHDB_DELETE_BATCH_SIZE,
+    GRAPHDB_TOP_COUNTERPARTIES,
+    ENTITY_TYPES,
+    RELATIONSHIP_TYPES,
+)
 from .utils import read_csv_as_dataframe
-from .text import eval_string_as_list
+from .graphsink import (
+    BoltGraphSink,
+    MemoryGraphSink,
+    SUPER_LABELS,
+    node_labels,
+    node_properties,
+    relationship_properties,
+)
+
+GRAPH_BACKENDS = ["bolt", "memory"]
 
 
 class GraphDB:
     """Generates neo4j database"""
 
-    def __init__(self, host, port, user, password, entities, relationships, logger):
+    def __init__(
+        self,
+        host,
+        port,
+        user,
+        password,
+        entities,
+        relationships,
+        logger,
+        batch_size=GRAPHDB_BATCH_SIZE,
+        schema=True,
+        delete_batch_size=GRAPHDB_DELETE_BATCH_SIZE,
+        workers=1,
+        backend="bolt",
+        aggregates=True,
+    ):
         """Initialise the neo4j graphdb class"""
         self.logger = logger
         self.host = host
@@ -27,169 +61,516 @@ class GraphDB:
         self.password = password
         self.entities = entities
         self.relationships = relationships
+        self.batch_size = batch_size
+        self.schema = schema
+        self.delete_batch_size = delete_batch_size
+        self.workers = workers
+        self.backend = backend
+        self.aggregates = aggregates
         self.logger = logger
 
-        graph = self.get_graphdb()
-        self.session = graph.session()
+        # the bolt sink connects on first use, exporting needs no server
+        self.sink = self.get_sink(backend)
+
+    def get_sink(self, backend):
+        """Get the graph sink of a backend"""
+        if backend == "memory":
+            return MemoryGraphSink(self.logger)
+        return BoltGraphSink(
+            self.host,
+            self.port,
+            self.user,
+            self.password,
+            self.logger,
+            batch_size=self.batch_size,
+            delete_batch_size=self.delete_batch_size,
+        )
 
     def execute(self):
         """Execute"""
+        time_start = time.time()
         self.delete_all_nodes_and_relationships()
 
         entities = read_csv_as_dataframe(self.entities)
         relationships = read_csv_as_dataframe(self.relationships)
 
-        for (_index, row) in relationships.iterrows():
-            source, target = None, None
-            _source = row["source"]
-            _target = row["target"]
-            _amount = row["amount"]
-            _recurring = row["recurring"]
-
-            source_filter = entities["name"].str.lower() == _source.lower()
-            source_match = entities.loc[source_filter]
-            if len(source_match):
-                source = source_match.to_dict(orient="records")[0]
-
-            target_filter = entities["name"].str.lower() == _target.lower()
-            target_match = entities.loc[target_filter]
-            if len(target_match):
-                target = target_match.to_dict(orient="records")[0]
-
-            if source and target and _recurring != "N/A":
-                source_node = self.create_node(source)
-                target_node = self.create_node(target)
-
-                relationship = row.to_dict()
-                del relationship["source"]
-                del relationship["target"]
-                del relationship["recurring"]
-
-                try:
-                    texts = eval_string_as_list(relationship["text"])
-                    text = "</br>".join(texts)
-                except:
-                    text = relationship["text"]
-                text = text.replace('"', "'")
-                relationship["text"] = text
-
-                if relationship["amount"] == "N/A":
-                    relationship["amount"] = 0
-                else:
-                    relationship["amount"] = int(float(relationship["amount"]))
+        (nodes, graph_relationships) = self.prepare(entities, relationships)
+        if self.schema:
+            self.create_schema(self.schema_labels(entities["entity_type"]))
 
-                self.create_relationship(source_node, target_node, relationship)
+        loaded = self.load_nodes(nodes)
+        self.logger.info("Loaded {} nodes".format(loaded))
+        loaded += self.load_relationships(graph_relationships)
+        if self.aggregates:
+            self.load_aggregates(self.compute_aggregates(entities, relationships))
 
-    def get_graphdb(self):
-        """Get a neo4j graph object"""
-        self.logger.info("Connecting to Neo4J")
-        url = NEO4J_URL.format(self.host, self.port)
-        graph = GraphDatabase.driver(url, auth=(self.user, self.password))
-        return graph
+        taken = time.time() - time_start
+        self.logger.info(
+            "Loaded {} nodes and relationships ({:.2f}s, {:.0f} rows/sec)".format(
+                loaded, taken, loaded / taken if taken else 0.0
+            )
+        )
+        return loaded
 
-    def delete_all_nodes_and_relationships(self):
-        """Clean existing db of nodes and relationships"""
-        self.logger.info("Cleaning graphdb")
-        self.session.run("MATCH (a) DETACH DELETE a")
+    def sync(self, previous_dir):
+        """
+        Apply only the differences from the previously loaded entities and
+        relationships csv files in previous_dir, instead of a full reload
+        """
+        time_start = time.time()
 
-    def create_node(self, node):
-        """Create neo4j node"""
-        self.logger.debug("Creating graphdb node: {}".format(node["name"]))
-
-        existing_node = self.get_node(node)
-        if not existing_node:
-            node_type = node["entity_type"]
-
-            if node_type in ["politician", "advisor"]:
-                node_type = ":".join([node_type, "person"])
-
-            elif node_type not in [
-                "person",
-                "politician",
-                "advisor",
-                "property",
-                "profession",
-            ]:
-                node_type = ":".join([node_type, "organisation"])
-
-            del node["entity_type"]
-            try:
-                cypher = "CREATE (n:{} {}) RETURN n, labels(n)".format(
-                    node_type, self.cypher_arguments_from_dict(node)
-                )
-                self.logger.debug("Cypher: {}".format(cypher))
-                result = self.session.run(cypher)
-                data = result.data()
-                return data[0]
-            except CypherSyntaxError as error:
-                self.logger.error("Failed to create node: {}".format(error))
-                return None
-
-            data = result.data()
-            return data[0]
-        return existing_node
+        entities = read_csv_as_dataframe(self.entities)
+        relationships = read_csv_as_dataframe(self.relationships)
+        (nodes, graph_relationships) = self.prepare(entities, relationships)
 
-    def get_node(self, node):
-        """Query for existing node"""
-        self.logger.debug("Getting graphdb node: {}".format(node["name"]))
-        try:
-            cypher = "MATCH (n:{} {}) RETURN n, labels(n)".format(
-                node["entity_type"],
-                self.cypher_arguments_from_dict({"name": node["name"]}),
+        (previous_nodes, previous_relationships) = self.prepare(
+            read_csv_as_dataframe(os.path.join(previous_dir, "entities.csv")),
+            read_csv_as_dataframe(os.path.join(previous_dir, "relationships.csv")),
+        )
+        if self.schema:
+            self.create_schema(self.schema_labels(entities["entity_type"]))
+
+        # nodes are keyed by labels and name, merged nodes are created or have
+        # their properties replaced, so removed properties don't linger
+        merged_nodes = {}
+        for (labels, properties) in nodes.items():
+            previous_properties = previous_nodes.get(labels, {})
+            for (name, _properties) in properties.items():
+                if previous_properties.get(name) != _properties:
+                    merged_nodes.setdefault(labels, {})[name] = _properties
+
+        deleted_nodes = {}
+        for (labels, properties) in previous_nodes.items():
+            for name in properties:
+                if name not in nodes.get(labels, {}):
+                    deleted_nodes.setdefault(labels, []).append({"name": name})
+
+        # relationships are keyed by type, endpoints and properties, and may repeat
+        counts = self.count_relationships(graph_relationships)
+        previous_counts = self.count_relationships(previous_relationships)
+
+        created_relationships = {}
+        deleted_relationships = {}
+        for key in set(counts) | set(previous_counts):
+            difference = counts.get(key, 0) - previous_counts.get(key, 0)
+            (group, source, target, properties) = key
+            row = {
+                "source": source,
+                "target": target,
+                "properties": json.loads(properties),
+            }
+            if difference > 0:
+                created_relationships.setdefault(group, []).extend([row] * difference)
+            elif difference < 0:
+                row["count"] = -difference
+                deleted_relationships.setdefault(group, []).append(row)
+
+        # relationships of deleted nodes go with them, merged nodes come first
+        deleted = self.delete_relationships(deleted_relationships)
+        deleted += self.delete_nodes(deleted_nodes)
+        merged = self.load_nodes(merged_nodes, replace=True)
+        merged += self.load_relationships(created_relationships)
+
+        # aggregates are recomputed in full, every type count is always set
+        if self.aggregates:
+            self.load_aggregates(self.compute_aggregates(entities, relationships))
+
+        self.logger.info(
+            "Synced {} merged and {} deleted nodes and relationships ({:.2f}s)".format(
+                merged, deleted, time.time() - time_start
             )
-            self.logger.debug("Cypher: {}".format(cypher))
-            result = self.session.run(cypher)
-        except CypherSyntaxError as error:
-            self.logger.error("Failed to query for node: {}".format(error))
-            return None
+        )
+        return (merged, deleted)
+
+    @staticmethod
+    def count_relationships(graph_relationships):
+        """Count relationships by group, endpoints and properties"""
+        counts = {}
+        for (group, rows) in graph_relationships.items():
+            for row in rows:
+                key = (
+                    group,
+                    row["source"],
+                    row["target"],
+                    json.dumps(row["properties"], sort_keys=True),
+                )
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def delete_nodes(self, nodes):
+        """Detach delete nodes, in batches per labels"""
+        deleted = 0
+        for (labels, rows) in nodes.items():
+            deleted += self.sink.delete_nodes(labels, rows)
+        return deleted
+
+    def delete_relationships(self, graph_relationships):
+        """Delete relationships, in batches per type and node labels"""
+        deleted = 0
+        for (group, rows) in graph_relationships.items():
+            deleted += self.sink.delete_relationships(group, rows)
+        return deleted
+
+    def export_admin_import(self, output_dir):
+        """
+        Write node and relationship csv files for an offline build with
+        neo4j-admin import, node names are the node ids
+        """
+        entities = read_csv_as_dataframe(self.entities)
+        relationships = read_csv_as_dataframe(self.relationships)
+        (nodes, graph_relationships) = self.prepare(entities, relationships)
 
-        data = result.data()
-        if len(data) > 0:
-            return data[0]
-        return None
+        if not os.path.exists(output_dir):
+            self.logger.debug("Making directoy: {}".format(output_dir))
+            os.makedirs(output_dir)
 
-    def create_relationship(self, source, target, relationship):
-        """Create neo4j relationship between two nodes"""
-        self.logger.info(
-            "Creating graphdb relationship: {} > {}".format(
-                source["n"]["name"], target["n"]["name"]
+        nodes_path = os.path.join(output_dir, "nodes.csv")
+        relationships_path = os.path.join(output_dir, "relationships.csv")
+
+        node_columns = []
+        for properties in nodes.values():
+            for _properties in properties.values():
+                node_columns.extend(
+                    key for key in _properties if key not in node_columns + ["name"]
+                )
+
+        with open(nodes_path, "w", newline="") as nodes_file:
+            writer = csv.writer(nodes_file)
+            writer.writerow(["name:ID"] + node_columns + [":LABEL"])
+            for (labels, properties) in nodes.items():
+                for (name, _properties) in properties.items():
+                    writer.writerow(
+                        [name]
+                        + [_properties.get(column, "") for column in node_columns]
+                        + [";".join(labels)]
+                    )
+
+        relationship_columns = []
+        for rows in graph_relationships.values():
+            for row in rows:
+                relationship_columns.extend(
+                    key
+                    for key in row["properties"]
+                    if key not in relationship_columns
+                )
+
+        with open(relationships_path, "w", newline="") as relationships_file:
+            writer = csv.writer(relationships_file)
+            writer.writerow(
+                [":START_ID", ":END_ID", ":TYPE"]
+                + [
+                    "{}:int".format(column) if column == "amount" else column
+                    for column in relationship_columns
+                ]
             )
+            for ((relationship_type, _source_type, _target_type), rows) in (
+                graph_relationships.items()
+            ):
+                for row in rows:
+                    writer.writerow(
+                        [row["source"], row["target"], relationship_type]
+                        + [
+                            row["properties"].get(column, "")
+                            for column in relationship_columns
+                        ]
+                    )
+
+        self.logger.info("Saved Nodes: {}".format(nodes_path))
+        self.logger.info("Saved Relationships: {}".format(relationships_path))
+        self.logger.info(
+            "Import with: neo4j-admin import --database=neo4j --multiline-fields=true "
+            "--nodes={} --relationships={}".format(nodes_path, relationships_path)
         )
 
-        source_name = source["n"]["name"]
-        target_name = target["n"]["name"]
-        source_labels = source["labels(n)"][0]
-        target_labels = target["labels(n)"][0]
+    def schema_labels(self, entity_types):
+        """All entity type and super labels, for the known and given entity types"""
+        return sorted(set(ENTITY_TYPES) | set(entity_types) | set(SUPER_LABELS))
+
+    def create_schema(self, labels):
+        """Create the name constraints and indexes"""
+        self.sink.create_schema(labels)
+
+    def drop_schema(self, labels):
+        """Drop the name constraints and indexes"""
+        self.sink.drop_schema(labels)
+
+    def index_entities(self, entities):
+        """
+        Index the entities by lowercase name, with their labels and node
+        properties prebuilt. The first of any duplicate names is kept
+        """
+        index = {}
+        for entity in entities.to_dict(orient="records"):
+            key = str(entity["name"]).lower()
+            if key not in index:
+                index[key] = {
+                    "name": entity["name"],
+                    "entity_type": entity["entity_type"],
+                    "labels": tuple(node_labels(entity["entity_type"])),
+                    "properties": node_properties(entity),
+                }
+        return index
+
+    def prepare(self, entities, relationships):
+        """
+        Group the nodes by labels, and relationships by type and node labels,
+        ready for loading in batches
+        """
+        entity_index = self.index_entities(entities)
+
+        nodes = {}
+        graph_relationships = {}
+        for row in relationships.to_dict(orient="records"):
+            source = entity_index.get(str(row["source"]).lower())
+            target = entity_index.get(str(row["target"]).lower())
+
+            if source and target and row.get("recurring", "N/A") != "N/A":
+                for node in [source, target]:
+                    nodes.setdefault(node["labels"], {})[node["name"]] = node[
+                        "properties"
+                    ]
+
+                key = (
+                    row["relationship_type"],
+                    source["entity_type"],
+                    target["entity_type"],
+                )
+                graph_relationships.setdefault(key, []).append(
+                    {
+                        "source": source["name"],
+                        "target": target["name"],
+                        "properties": relationship_properties(row),
+                    }
+                )
+
+        return (nodes, graph_relationships)
+
+    def compute_aggregates(self, entities, relationships):
+        """
+        Totals of each loaded node's relationships, in either direction:
+        declared and recurring amounts, counts per relationship type and the
+        top counterparties by amount then count
+        """
+        time_start = time.time()
+        entity_index = self.index_entities(entities)
+
+        if "recurring" in relationships.columns:
+            recurring = relationships["recurring"].astype(str)
+        else:
+            recurring = "N/A"
+
+        # the same relationships prepare loads, keyed by lowercase name
+        frame = pandas.DataFrame(
+            {
+                "source": relationships["source"].astype(str).str.lower(),
+                "target": relationships["target"].astype(str).str.lower(),
+                "relationship_type": relationships["relationship_type"],
+                "amount": pandas.to_numeric(relationships["amount"], errors="coerce")
+                .fillna(0)
+                .astype("int64"),
+                "recurring": recurring,
+            }
+        )
+        frame = frame[
+            frame["source"].isin(entity_index)
+            & frame["target"].isin(entity_index)
+            & (frame["recurring"] != "N/A")
+        ]
+
+        # each end of a relationship, self relationships counted once
+        reverse = frame[frame["source"] != frame["target"]]
+        ends = pandas.concat(
+            [
+                frame.rename(columns={"source": "node", "target": "counterparty"}),
+                reverse.rename(columns={"target": "node", "source": "counterparty"}),
+            ]
+        )
+        grouped = ends.groupby("node")
+        totals = grouped["amount"].sum()
+        counts = grouped.size()
+        recurring_totals = (
+            ends[ends["recurring"] == "True"]
+            .groupby("node")["amount"]
+            .sum()
+            .reindex(totals.index, fill_value=0)
+        )
 
-        relationship_type = relationship["relationship_type"]
-        relationship_data = self.cypher_arguments_from_dict(relationship)
+        relationship_types = sorted(
+            set(RELATIONSHIP_TYPES) | set(frame["relationship_type"])
+        )
+        type_counts = (
+            ends.groupby(["node", "relationship_type"])
+            .size()
+            .unstack(fill_value=0)
+            .reindex(index=totals.index, columns=relationship_types, fill_value=0)
+        )
 
-        try:
-            cypher = "MATCH (a:{}),(b:{}) ".format(source_labels, target_labels)
-            cypher += 'WHERE a.name = "{}" AND b.name = "{}" '.format(
-                source_name, target_name
+        counterparties = (
+            ends.groupby(["node", "counterparty"])["amount"]
+            .agg(["sum", "size"])
+            .reset_index()
+            .sort_values(
+                ["node", "sum", "size", "counterparty"],
+                ascending=[True, False, False, True],
             )
-            cypher += "CREATE (a)-[r:{} {}]->(b) ".format(
-                relationship_type, relationship_data
+            .groupby("node")
+            .head(GRAPHDB_TOP_COUNTERPARTIES)
+        )
+        top = {}
+        for (node, counterparty, amount) in counterparties[
+            ["node", "counterparty", "sum"]
+        ].itertuples(index=False):
+            top.setdefault(node, []).append(
+                (entity_index[counterparty]["name"], int(amount))
+            )
+
+        aggregates = {}
+        for (node, type_row) in zip(totals.index, type_counts.to_dict("records")):
+            properties = {
+                "total_amount": int(totals[node]),
+                "recurring_amount": int(recurring_totals[node]),
+                "relationship_count": int(counts[node]),
+                "top_counterparties": [name for (name, _) in top[node]],
+                "top_counterparty_amounts": [amount for (_, amount) in top[node]],
+            }
+            for (relationship_type, count) in type_row.items():
+                properties["{}_count".format(relationship_type)] = int(count)
+
+            entity = entity_index[node]
+            aggregates.setdefault(entity["labels"], []).append(
+                {"name": entity["name"], "properties": properties}
+            )
+
+        self.logger.info(
+            "Computed aggregates of {} nodes ({:.2f}s)".format(
+                len(totals), time.time() - time_start
+            )
+        )
+        return aggregates
+
+    def load_aggregates(self, aggregates):
+        """Set the aggregates on their nodes, in batches per labels"""
+        updated = 0
+        for (labels, rows) in aggregates.items():
+            updated += self.sink.update_nodes(labels, rows)
+        self.logger.info("Updated aggregates of {} nodes".format(updated))
+        return updated
+
+    def load_nodes(self, nodes, replace=False):
+        """
+        Merge the nodes, in batches per labels, replacing the properties of
+        existing nodes if replace is set
+        """
+        loaded = 0
+        for (labels, properties) in nodes.items():
+            rows = [
+                {"name": name, "properties": _properties}
+                for (name, _properties) in properties.items()
+            ]
+            if replace:
+                loaded += self.sink.replace_nodes(labels, rows)
+            else:
+                loaded += self.sink.merge_nodes(labels, rows)
+        return loaded
+
+    def load_relationships(self, graph_relationships):
+        """Create the relationships, in batches per type and node labels"""
+        if self.workers > 1:
+            return self.load_relationships_parallel(graph_relationships)
+
+        loaded = 0
+        for (group, rows) in graph_relationships.items():
+            loaded += self.sink.create_relationships(group, rows)
+        return loaded
+
+    def load_relationships_parallel(self, graph_relationships):
+        """
+        Create the relationships in waves of concurrent batches, each in its
+        own transaction. Batches within a wave touch disjoint sets of nodes, so
+        their transactions never wait on each other's node locks
+        """
+        time_start = time.time()
+        waves = self.plan_relationship_waves(graph_relationships)
+
+        loaded = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (index, wave) in enumerate(waves):
+                loaded += sum(executor.map(self.run_relationship_batch, wave))
+                self.logger.debug(
+                    "Loaded relationship wave {}/{} ({} batches)".format(
+                        index + 1, len(waves), len(wave)
+                    )
+                )
+
+        taken = time.time() - time_start
+        self.logger.info(
+            "Loaded {} relationships in {} waves ({:.0f} rows/sec)".format(
+                loaded, len(waves), loaded / taken if taken else 0.0
             )
-            cypher += "RETURN r"
-
-            self.logger.debug("Cypher: {}".format(cypher))
-            result = self.session.run(cypher)
-        except CypherSyntaxError as error:
-            self.logger.error("Failed to create relationship: {}".format(error))
-            return None
-
-        data = result.data()
-        return data[0]
-
-    def cypher_arguments_from_dict(self, data):
-        """Convert dictionary to cypher query arguments"""
-        node_string = ""
-        for key, value in data.items():
-            if key not in ["relationship_type", "entity_type", "aliases", "resolved"]:
-                if key == "amount":
-                    node_string += "{}: {}, ".format(key, value)
+        )
+        return loaded
+
+    def plan_relationship_waves(self, graph_relationships):
+        """
+        Partition the relationships into waves of at most workers batches,
+        where no node is touched by more than one batch of a wave
+        """
+        waves = []
+        for (group, rows) in graph_relationships.items():
+            for row in rows:
+                for wave in waves:
+                    if self.add_to_wave(wave, group, row):
+                        break
                 else:
-                    node_string += '{}: "{}", '.format(key, value)
-        return "{" + node_string[:-2] + "}"
+                    wave = {"batches": [], "nodes": {}}
+                    waves.append(wave)
+                    self.add_to_wave(wave, group, row)
+
+        return [wave["batches"] for wave in waves]
+
+    def add_to_wave(self, wave, group, row):
+        """Add a relationship to the wave's batch owning its nodes, if possible"""
+        nodes = [row["source"], row["target"]]
+        owners = {wave["nodes"][node] for node in nodes if node in wave["nodes"]}
+        batches = wave["batches"]
+
+        if len(owners) > 1:
+            return False
+
+        if owners:
+            index = owners.pop()
+        elif len(batches) < self.workers:
+            batches.append({"size": 0, "rows": {}})
+            index = len(batches) - 1
+        else:
+            index = min(range(len(batches)), key=lambda _index: batches[_index]["size"])
+
+        if batches[index]["size"] >= self.batch_size:
+            return False
+
+        batches[index]["rows"].setdefault(group, []).append(row)
+        batches[index]["size"] += 1
+        for node in nodes:
+            wave["nodes"][node] = index
+        return True
+
+    def run_relationship_batch(self, batch):
+        """Create a batch of relationships of a wave"""
+        return self.sink.create_relationship_groups(batch["rows"])
+
+    def delete_all_nodes_and_relationships(self):
+        """Clean existing db of nodes and relationships"""
+        self.logger.info("Cleaning graphdb")
+        self.sink.delete_all()
+
+    def create_node(self, node):
+        """Create graph node"""
+        return self.sink.create_node(node)
+
+    def get_node(self, node):
+        """Query for existing node"""
+        return self.sink.get_node(node)
+
+    def create_relationship(self, source, target, relationship):
+        """Create graph relationship between two nodes"""
+        return self.sink.create_relationship(source, target, relationship)
@@ -0,0 +1,722 @@
+"""
+Module for the graph backends written to by the graphdb loader
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import time
+import itertools
+import threading
+from abc import ABC, abstractmethod
+
+# third party libs
+from neo4j import GraphDatabase
+from neo4j.exceptions import CypherSyntaxError
+
+# local libs
+from .constants import NEO4J_URL, GRAPHDB_BATCH_SIZE, GRAPHDB_DELETE_BATCH_SIZE
+from .text import eval_string_as_list
+
+SUPER_LABELS = ["person", "organisation"]
+NODE_EXCLUDED_PROPERTIES = ["entity_type", "aliases"]
+RELATIONSHIP_EXCLUDED_PROPERTIES = [
+    "source",
+    "target",
+    "recurring",
+    "relationship_type",
+    "resolved",
+]
+
+# statement templates, only labels and relationship types are formatted in
+# so each label or type always produces the same statement, values are
+# passed as parameters
+GET_NODE_CYPHER = "MATCH (n:{label} {{name: $name}}) RETURN n, labels(n)"
+CREATE_NODE_CYPHER = "CREATE (n:{labels}) SET n = $properties RETURN n, labels(n)"
+CREATE_RELATIONSHIP_CYPHER = (
+    "MATCH (a:{source_label} {{name: $source}}) "
+    "MATCH (b:{target_label} {{name: $target}}) "
+    "CREATE (a)-[r:{relationship_type}]->(b) "
+    "SET r = $properties "
+    "RETURN r"
+)
+# schema, entity type labels are unique by name, super labels only indexed
+# as one name may be e.g. both a person and politician:person
+CREATE_NAME_CONSTRAINT_CYPHER = (
+    "CREATE CONSTRAINT {label}_name_unique IF NOT EXISTS "
+    "ON (n:{label}) ASSERT n.name IS UNIQUE"
+)
+CREATE_NAME_INDEX_CYPHER = (
+    "CREATE INDEX {label}_name IF NOT EXISTS FOR (n:{label}) ON (n.name)"
+)
+DROP_NAME_CONSTRAINT_CYPHER = "DROP CONSTRAINT {label}_name_unique IF EXISTS"
+DROP_NAME_INDEX_CYPHER = "DROP INDEX {label}_name IF EXISTS"
+
+UNWIND_NODES_CYPHER = (
+    "UNWIND $rows AS row "
+    "MERGE (n:{label} {{name: row.name}}) "
+    "SET {super_labels}n += row.properties"
+)
+REPLACE_NODES_CYPHER = (
+    "UNWIND $rows AS row "
+    "MERGE (n:{label} {{name: row.name}}) "
+    "SET n = row.properties, n:{labels}"
+)
+UPDATE_NODES_CYPHER = (
+    "UNWIND $rows AS row "
+    "MATCH (n:{label} {{name: row.name}}) "
+    "SET n += row.properties"
+)
+DELETE_RELATIONSHIPS_BATCH_CYPHER = "MATCH ()-[r]->() WITH r LIMIT $limit DELETE r"
+DELETE_NODES_BATCH_CYPHER = "MATCH (n) WITH n LIMIT $limit DETACH DELETE n"
+DELETE_NODES_CYPHER = (
+    "UNWIND $rows AS row MATCH (n:{label} {{name: row.name}}) DETACH DELETE n"
+)
+DELETE_RELATIONSHIPS_CYPHER = (
+    "UNWIND $rows AS row "
+    "MATCH (a:{source_label} {{name: row.source}})"
+    "-[r:{relationship_type}]->"
+    "(b:{target_label} {{name: row.target}}) "
+    "WHERE properties(r) = row.properties "
+    "WITH row, collect(r)[..row.count] AS matches "
+    "UNWIND matches AS r DELETE r"
+)
+UNWIND_RELATIONSHIPS_CYPHER = (
+    "UNWIND $rows AS row "
+    "MATCH (a:{source_label} {{name: row.source}}) "
+    "MATCH (b:{target_label} {{name: row.target}}) "
+    "CREATE (a)-[r:{relationship_type}]->(b) "
+    "SET r = row.properties"
+)
+
+
+def node_labels(entity_type):
+    """Neo4j labels of an entity type, followed by any person/organisation label"""
+    if entity_type in ["politician", "advisor"]:
+        return [entity_type, "person"]
+
+    if entity_type not in [
+        "person",
+        "politician",
+        "advisor",
+        "property",
+        "profession",
+    ]:
+        return [entity_type, "organisation"]
+
+    return [entity_type]
+
+
+def node_properties(entity):
+    """Node properties of an entity record"""
+    return {
+        key: str(value)
+        for (key, value) in entity.items()
+        if key not in NODE_EXCLUDED_PROPERTIES
+    }
+
+
+def relationship_properties(relationship):
+    """Relationship properties of a relationship row"""
+    properties = {}
+    for (key, value) in relationship.items():
+        if key not in RELATIONSHIP_EXCLUDED_PROPERTIES:
+            properties[key] = str(value)
+
+    try:
+        texts = eval_string_as_list(properties["text"])
+        properties["text"] = "</br>".join(texts)
+    except:
+        pass
+
+    if properties["amount"] == "N/A":
+        properties["amount"] = 0
+    else:
+        properties["amount"] = int(float(properties["amount"]))
+    return properties
+
+
+class GraphSink(ABC):
+    """
+    Graph backend interface. Nodes are merged per labels, the first label
+    being the entity type, and relationships are grouped by
+    (relationship_type, source_label, target_label)
+    """
+
+    def __init__(self, logger):
+        """Initialise the graph sink"""
+        self.logger = logger
+
+    @abstractmethod
+    def create_node(self, node):
+        """Create a node for an entity record, unless one exists"""
+
+    @abstractmethod
+    def get_node(self, node):
+        """Query for an existing node of an entity record"""
+
+    @abstractmethod
+    def create_relationship(self, source, target, relationship):
+        """Create a relationship between two nodes returned by get_node"""
+
+    @abstractmethod
+    def merge_nodes(self, labels, rows):
+        """Merge {name, properties} rows as nodes of labels"""
+
+    @abstractmethod
+    def replace_nodes(self, labels, rows):
+        """
+        Merge {name, properties} rows as nodes of labels, replacing all the
+        properties of existing nodes
+        """
+
+    @abstractmethod
+    def update_nodes(self, labels, rows):
+        """Set {name, properties} rows on the existing nodes of labels"""
+
+    @abstractmethod
+    def create_relationships(self, group, rows):
+        """Create {source, target, properties} rows as relationships of a group"""
+
+    @abstractmethod
+    def create_relationship_groups(self, groups):
+        """
+        Create relationships of several groups as one unit of work, safe to
+        call from concurrent threads
+        """
+
+    @abstractmethod
+    def delete_nodes(self, labels, rows):
+        """Detach delete the nodes of labels named by {name} rows"""
+
+    @abstractmethod
+    def delete_relationships(self, group, rows):
+        """
+        Delete up to count relationships of a group per
+        {source, target, properties, count} row
+        """
+
+    @abstractmethod
+    def delete_all(self):
+        """Delete all nodes and relationships"""
+
+    @abstractmethod
+    def create_schema(self, labels):
+        """Create name constraints and indexes for labels"""
+
+    @abstractmethod
+    def drop_schema(self, labels):
+        """Drop the name constraints and indexes of labels"""
+
+
+class BoltGraphSink(GraphSink):
+    """Neo4j server backend, over the bolt protocol"""
+
+    def __init__(
+        self,
+        host,
+        port,
+        user,
+        password,
+        logger,
+        batch_size=GRAPHDB_BATCH_SIZE,
+        delete_batch_size=GRAPHDB_DELETE_BATCH_SIZE,
+    ):
+        """Initialise the bolt graph sink"""
+        super().__init__(logger)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.batch_size = batch_size
+        self.delete_batch_size = delete_batch_size
+
+        # connect on first use
+        self._graph = None
+        self._session = None
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = self.get_graphdb()
+        return self._graph
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self.graph.session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def get_graphdb(self):
+        """Get a neo4j graph object"""
+        self.logger.info("Connecting to Neo4J")
+        url = NEO4J_URL.format(self.host, self.port)
+        graph = GraphDatabase.driver(url, auth=(self.user, self.password))
+        return graph
+
+    def merge_nodes(self, labels, rows):
+        """Merge nodes of labels, one transaction per batch"""
+        cypher = UNWIND_NODES_CYPHER.format(
+            label=labels[0],
+            super_labels="".join("n:{}, ".format(label) for label in labels[1:]),
+        )
+        return self.run_batches(cypher, rows, ":".join(labels))
+
+    def replace_nodes(self, labels, rows):
+        """Merge nodes of labels, replacing properties, one transaction per batch"""
+        cypher = REPLACE_NODES_CYPHER.format(label=labels[0], labels=":".join(labels))
+        return self.run_batches(cypher, rows, "replaced {}".format(":".join(labels)))
+
+    def update_nodes(self, labels, rows):
+        """Set properties on existing nodes of labels, one transaction per batch"""
+        cypher = UPDATE_NODES_CYPHER.format(label=labels[0])
+        return self.run_batches(cypher, rows, "updated {}".format(labels[0]))
+
+    def create_relationships(self, group, rows):
+        """Create relationships of a group, one transaction per batch"""
+        (relationship_type, source_label, target_label) = group
+        cypher = UNWIND_RELATIONSHIPS_CYPHER.format(
+            relationship_type=relationship_type,
+            source_label=source_label,
+            target_label=target_label,
+        )
+        return self.run_batches(
+            cypher,
+            rows,
+            "{}:{}>{}".format(source_label, relationship_type, target_label),
+        )
+
+    def create_relationship_groups(self, groups):
+        """Create relationships of several groups in one transaction, new session"""
+        with self.graph.session() as session:
+            session.write_transaction(self.run_relationship_groups, groups)
+        return sum(len(rows) for rows in groups.values())
+
+    @staticmethod
+    def run_relationship_groups(transaction, groups):
+        """Transaction function creating relationships of several groups"""
+        for (group, rows) in groups.items():
+            (relationship_type, source_label, target_label) = group
+            cypher = UNWIND_RELATIONSHIPS_CYPHER.format(
+                relationship_type=relationship_type,
+                source_label=source_label,
+                target_label=target_label,
+            )
+            transaction.run(cypher, rows=rows).consume()
+
+    def delete_nodes(self, labels, rows):
+        """Detach delete nodes of labels, one transaction per batch"""
+        cypher = DELETE_NODES_CYPHER.format(label=labels[0])
+        return self.run_batches(cypher, rows, "deleted {}".format(labels[0]))
+
+    def delete_relationships(self, group, rows):
+        """Delete relationships of a group, one transaction per batch"""
+        (relationship_type, source_label, target_label) = group
+        cypher = DELETE_RELATIONSHIPS_CYPHER.format(
+            relationship_type=relationship_type,
+            source_label=source_label,
+            target_label=target_label,
+        )
+        description = "deleted {}:{}>{}".format(
+            source_label, relationship_type, target_label
+        )
+        return self.run_batches(cypher, rows, description)
+
+    def run_batches(self, cypher, rows, description):
+        """Run an UNWIND statement over rows, one transaction per batch"""
+        time_start = time.time()
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start : start + self.batch_size]
+            self.session.write_transaction(self.run_batch, cypher, batch)
+
+        taken = time.time() - time_start
+        self.logger.debug(
+            "Loaded {} {} ({:.0f} rows/sec)".format(
+                len(rows), description, len(rows) / taken if taken else 0.0
+            )
+        )
+        return len(rows)
+
+    @staticmethod
+    def run_batch(transaction, cypher, rows):
+        """Transaction function running an UNWIND statement over a batch"""
+        return transaction.run(cypher, rows=rows).consume()
+
+    def delete_all(self):
+        """
+        Clean existing db of nodes and relationships, relationships first so
+        each transaction deletes at most delete_batch_size of either
+        """
+        deleted = self.delete_in_batches(DELETE_RELATIONSHIPS_BATCH_CYPHER)
+        self.logger.info("Deleted {} relationships".format(deleted))
+        deleted = self.delete_in_batches(DELETE_NODES_BATCH_CYPHER)
+        self.logger.info("Deleted {} nodes".format(deleted))
+
+    def delete_in_batches(self, cypher):
+        """Run a LIMIT $limit delete statement until nothing is deleted"""
+        total = 0
+        while True:
+            summary = self.session.run(cypher, limit=self.delete_batch_size).consume()
+            deleted = summary.counters.nodes_deleted
+            deleted += summary.counters.relationships_deleted
+            if not deleted:
+                return total
+
+            total += deleted
+            self.logger.info("Deleted {}".format(total))
+
+    def create_schema(self, labels):
+        """
+        Create name uniqueness constraints for entity type labels and name
+        indexes for super labels, so node lookups by name are index seeks
+        """
+        time_start = time.time()
+        for label in labels:
+            if label in SUPER_LABELS:
+                cypher = CREATE_NAME_INDEX_CYPHER.format(label=label)
+            else:
+                cypher = CREATE_NAME_CONSTRAINT_CYPHER.format(label=label)
+            self.logger.debug("Cypher: {}".format(cypher))
+            self.session.run(cypher).consume()
+
+        self.session.run("CALL db.awaitIndexes()").consume()
+        self.logger.info(
+            "Created schema for {} labels ({:.2f}s)".format(
+                len(labels), time.time() - time_start
+            )
+        )
+
+    def drop_schema(self, labels):
+        """Drop the name constraints and indexes"""
+        for label in labels:
+            if label in SUPER_LABELS:
+                cypher = DROP_NAME_INDEX_CYPHER.format(label=label)
+            else:
+                cypher = DROP_NAME_CONSTRAINT_CYPHER.format(label=label)
+            self.logger.debug("Cypher: {}".format(cypher))
+            self.session.run(cypher).consume()
+
+    def create_node(self, node):
+        """Create neo4j node"""
+        self.logger.debug("Creating graphdb node: {}".format(node["name"]))
+
+        existing_node = self.get_node(node)
+        if not existing_node:
+            cypher = CREATE_NODE_CYPHER.format(
+                labels=":".join(node_labels(node["entity_type"]))
+            )
+            try:
+                self.logger.debug("Cypher: {}".format(cypher))
+                result = self.session.run(cypher, properties=node_properties(node))
+            except CypherSyntaxError as error:
+                self.logger.error("Failed to create node: {}".format(error))
+                return None
+
+            data = result.data()
+            return data[0]
+        return existing_node
+
+    def get_node(self, node):
+        """Query for existing node"""
+        self.logger.debug("Getting graphdb node: {}".format(node["name"]))
+        cypher = GET_NODE_CYPHER.format(label=node["entity_type"])
+        try:
+            self.logger.debug("Cypher: {}".format(cypher))
+            result = self.session.run(cypher, name=node["name"])
+        except CypherSyntaxError as error:
+            self.logger.error("Failed to query for node: {}".format(error))
+            return None
+
+        data = result.data()
+        if len(data) > 0:
+            return data[0]
+        return None
+
+    def create_relationship(self, source, target, relationship):
+        """Create neo4j relationship between two nodes"""
+        self.logger.info(
+            "Creating graphdb relationship: {} > {}".format(
+                source["n"]["name"], target["n"]["name"]
+            )
+        )
+
+        cypher = CREATE_RELATIONSHIP_CYPHER.format(
+            relationship_type=relationship["relationship_type"],
+            source_label=source["labels(n)"][0],
+            target_label=target["labels(n)"][0],
+        )
+        properties = {
+            key: value
+            for (key, value) in relationship.items()
+            if key not in RELATIONSHIP_EXCLUDED_PROPERTIES
+        }
+
+        try:
+            self.logger.debug("Cypher: {}".format(cypher))
+            result = self.session.run(
+                cypher,
+                source=source["n"]["name"],
+                target=target["n"]["name"],
+                properties=properties,
+            )
+        except CypherSyntaxError as error:
+            self.logger.error("Failed to create relationship: {}".format(error))
+            return None
+
+        data = result.data()
+        return data[0]
+
+
+class MemoryGraphSink(GraphSink):
+    """
+    In process backend, a labelled property graph held as plain
+    dictionaries with adjacency sets, following the bolt statements'
+    semantics: nodes merge on their first label and name, relationships
+    are only created between existing nodes
+    """
+
+    def __init__(self, logger):
+        """Initialise an empty graph"""
+        super().__init__(logger)
+        self.nodes = {}
+        self.relationships = {}
+        self.outgoing = {}
+        self.incoming = {}
+
+        # label > name > node id, as the name constraints and indexes
+        self.labels = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def find_node(self, label, name):
+        """Id of the node of label and name, or None"""
+        return self.labels.get(label, {}).get(name)
+
+    def add_node(self, labels, properties):
+        """Add a node, returning its id"""
+        node_id = next(self._ids)
+        self.nodes[node_id] = {"labels": [], "properties": dict(properties)}
+        self.outgoing[node_id] = set()
+        self.incoming[node_id] = set()
+        self.add_labels(node_id, labels)
+        return node_id
+
+    def add_labels(self, node_id, labels):
+        """Add labels to a node, indexing it by name under each"""
+        node = self.nodes[node_id]
+        for label in labels:
+            if label not in node["labels"]:
+                node["labels"].append(label)
+            self.labels.setdefault(label, {})[node["properties"].get("name")] = node_id
+
+    def remove_node(self, node_id):
+        """Detach delete a node"""
+        for relationship_id in self.outgoing[node_id] | self.incoming[node_id]:
+            self.remove_relationship(relationship_id)
+
+        node = self.nodes.pop(node_id)
+        for label in node["labels"]:
+            names = self.labels[label]
+            if names.get(node["properties"].get("name")) == node_id:
+                del names[node["properties"].get("name")]
+        del self.outgoing[node_id]
+        del self.incoming[node_id]
+
+    def add_relationship(self, relationship_type, source_id, target_id, properties):
+        """Add a relationship between two nodes, returning its id"""
+        relationship_id = next(self._ids)
+        self.relationships[relationship_id] = {
+            "type": relationship_type,
+            "source": source_id,
+            "target": target_id,
+            "properties": dict(properties),
+        }
+        self.outgoing[source_id].add(relationship_id)
+        self.incoming[target_id].add(relationship_id)
+        return relationship_id
+
+    def remove_relationship(self, relationship_id):
+        """Delete a relationship"""
+        relationship = self.relationships.pop(relationship_id)
+        self.outgoing[relationship["source"]].discard(relationship_id)
+        self.incoming[relationship["target"]].discard(relationship_id)
+
+    def node_data(self, node_id):
+        """A node as returned by the bolt get_node"""
+        node = self.nodes[node_id]
+        return {"n": dict(node["properties"]), "labels(n)": list(node["labels"])}
+
+    def merge_nodes(self, labels, rows):
+        """Merge nodes of labels"""
+        with self._lock:
+            for row in rows:
+                node_id = self.find_node(labels[0], row["name"])
+                if node_id is None:
+                    node_id = self.add_node(labels[:1], {"name": row["name"]})
+                self.nodes[node_id]["properties"].update(row["properties"])
+                self.add_labels(node_id, labels[1:])
+        return len(rows)
+
+    def replace_nodes(self, labels, rows):
+        """Merge nodes of labels, replacing their properties"""
+        with self._lock:
+            for row in rows:
+                node_id = self.find_node(labels[0], row["name"])
+                if node_id is None:
+                    node_id = self.add_node(labels, row["properties"])
+                else:
+                    self.nodes[node_id]["properties"] = dict(row["properties"])
+                    self.add_labels(node_id, labels)
+        return len(rows)
+
+    def update_nodes(self, labels, rows):
+        """Set properties on existing nodes of labels"""
+        with self._lock:
+            for row in rows:
+                node_id = self.find_node(labels[0], row["name"])
+                if node_id is not None:
+                    self.nodes[node_id]["properties"].update(row["properties"])
+        return len(rows)
+
+    def create_relationships(self, group, rows):
+        """Create relationships of a group"""
+        with self._lock:
+            return self.add_relationship_rows(group, rows)
+
+    def create_relationship_groups(self, groups):
+        """Create relationships of several groups under one lock"""
+        with self._lock:
+            return sum(
+                self.add_relationship_rows(group, rows)
+                for (group, rows) in groups.items()
+            )
+
+    def add_relationship_rows(self, group, rows):
+        """Create relationship rows whose source and target nodes exist"""
+        (relationship_type, source_label, target_label) = group
+        for row in rows:
+            source_id = self.find_node(source_label, row["source"])
+            target_id = self.find_node(target_label, row["target"])
+            if source_id is not None and target_id is not None:
+                self.add_relationship(
+                    relationship_type, source_id, target_id, row["properties"]
+                )
+        return len(rows)
+
+    def delete_nodes(self, labels, rows):
+        """Detach delete nodes of labels"""
+        with self._lock:
+            for row in rows:
+                node_id = self.find_node(labels[0], row["name"])
+                if node_id is not None:
+                    self.remove_node(node_id)
+        return len(rows)
+
+    def delete_relationships(self, group, rows):
+        """Delete up to count matching relationships per row"""
+        (relationship_type, source_label, target_label) = group
+        with self._lock:
+            for row in rows:
+                source_id = self.find_node(source_label, row["source"])
+                target_id = self.find_node(target_label, row["target"])
+                if source_id is None or target_id is None:
+                    continue
+
+                matches = [
+                    relationship_id
+                    for relationship_id in sorted(self.outgoing[source_id])
+                    if self.relationships[relationship_id]["type"] == relationship_type
+                    and self.relationships[relationship_id]["target"] == target_id
+                    and self.relationships[relationship_id]["properties"]
+                    == row["properties"]
+                ]
+                for relationship_id in matches[: row["count"]]:
+                    self.remove_relationship(relationship_id)
+        return len(rows)
+
+    def delete_all(self):
+        """Delete all nodes and relationships"""
+        with self._lock:
+            self.logger.info(
+                "Deleted {} relationships and {} nodes".format(
+                    len(self.relationships), len(self.nodes)
+                )
+            )
+            self.nodes.clear()
+            self.relationships.clear()
+            self.outgoing.clear()
+            self.incoming.clear()
+            self.labels.clear()
+
+    def create_schema(self, labels):
+        """Nodes are always indexed by label and name"""
+        self.logger.debug("Schema for {} labels is implicit".format(len(labels)))
+
+    def drop_schema(self, labels):
+        """Nodes are always indexed by label and name"""
+        self.logger.debug("Schema for {} labels is implicit".format(len(labels)))
+
+    def create_node(self, node):
+        """Create a node, unless one exists"""
+        existing_node = self.get_node(node)
+        if existing_node:
+            return existing_node
+
+        with self._lock:
+            node_id = self.add_node(
+                node_labels(node["entity_type"]), node_properties(node)
+            )
+            return self.node_data(node_id)
+
+    def get_node(self, node):
+        """Query for an existing node"""
+        node_id = self.find_node(node["entity_type"], node["name"])
+        if node_id is None:
+            return None
+        return self.node_data(node_id)
+
+    def create_relationship(self, source, target, relationship):
+        """Create a relationship between two nodes"""
+        source_id = self.find_node(source["labels(n)"][0], source["n"]["name"])
+        target_id = self.find_node(target["labels(n)"][0], target["n"]["name"])
+        if source_id is None or target_id is None:
+            return None
+
+        properties = {
+            key: value
+            for (key, value) in relationship.items()
+            if key not in RELATIONSHIP_EXCLUDED_PROPERTIES
+        }
+        with self._lock:
+            relationship_id = self.add_relationship(
+                relationship["relationship_type"], source_id, target_id, properties
+            )
+        return {"r": dict(self.relationships[relationship_id]["properties"])}
+
+    def count_labels(self):
+        """Number of nodes per label"""
+        return {label: len(names) for (label, names) in self.labels.items()}
+
+    def count_relationship_types(self):
+        """Number of relationships per type"""
+        counts = {}
+        for relationship in self.relationships.values():
+            counts[relationship["type"]] = counts.get(relationship["type"], 0) + 1
+        return counts
+
+    def log(self, logger):
+        """Log the node and relationship counts"""
+        logger.info(
+            "Memory graph: {} nodes, {} relationships".format(
+                len(self.nodes), len(self.relationships)
+            )
+        )
+        for (label, count) in sorted(self.count_labels().items()):
+            logger.debug("Label {}: {}".format(label, count))
+        for (relationship_type, count) in sorted(
+            self.count_relationship_types().items()
+        ):
+            logger.debug("Relationship {}: {}".format(relationship_type, count))
@@ -0,0 +1,87 @@
+"""
+Module for reusing the extraction results of a previous snapshot
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import os
+import json
+import hashlib
+
+# local libs
+from .utils import read_csv_as_dataframe
+from .registry import EntityRegistry
+
+
+def relationship_key(relationship):
+    """Content hash of a relationship's source, type and text"""
+    data = json.dumps(
+        [
+            str(relationship["source"]),
+            str(relationship["relationship_type"]),
+            str(relationship["text"]),
+        ]
+    )
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class PreviousExtraction:
+    """Resolved relationships and entities of a previously extracted snapshot"""
+
+    def __init__(self, snapshot_dir, logger):
+        """Read the snapshot's relationships and its extracted output"""
+        self.snapshot_dir = snapshot_dir
+        self.logger = logger
+
+        relationships = read_csv_as_dataframe(
+            os.path.join(snapshot_dir, "relationships.csv")
+        )
+        extracted_relationships = read_csv_as_dataframe(
+            os.path.join(snapshot_dir, "extracted", "relationships.csv")
+        )
+        self.entities = EntityRegistry.from_dataframe(
+            read_csv_as_dataframe(
+                os.path.join(snapshot_dir, "extracted", "entities.csv")
+            )
+        )
+
+        # input rows sharing a key are ambiguous, their outputs can't be told apart
+        counts = {}
+        for relationship in relationships.to_dict(orient="records"):
+            key = relationship_key(relationship)
+            counts[key] = counts.get(key, 0) + 1
+
+        self._results = {}
+        for relationship in extracted_relationships.to_dict(orient="records"):
+            key = relationship_key(relationship)
+            if counts.get(key) == 1:
+                self._results.setdefault(key, []).append(relationship)
+
+        # only fully resolved results are reused, anything else is solved again
+        for (key, results) in list(self._results.items()):
+            if not all(str(result["resolved"]) == "True" for result in results):
+                del self._results[key]
+
+        self.logger.info(
+            "Previous snapshot {}: {} resolved relationships".format(
+                snapshot_dir, len(self._results)
+            )
+        )
+
+    def get_relationships(self, relationship):
+        """
+        Get the previous output rows and target entities for an unchanged
+        relationship, or None if it has to be solved again
+        """
+        if relationship["source"] == "UNKNOWN":
+            return None
+
+        results = self._results.get(relationship_key(relationship))
+        if not results:
+            return None
+
+        entities = [self.entities.get(result["target"]) for result in results]
+        if not all(entities):
+            return None
+
+        return list(zip(results, entities))
@@ -0,0 +1,49 @@
+"""
+Module for named entity recognition helpers
+"""
+# -*- coding: utf-8 -*-
+
+# local libs
+from .constants import NLP_BATCH_SIZE
+
+
+class NlpCache:
+    """Wraps a spacy model, caching parsed docs and entities by text"""
+
+    def __init__(self, nlp, logger):
+        """Initialise the cache around a loaded spacy model"""
+        self.nlp = nlp
+        self.logger = logger
+        self._docs = {}
+        self._entities = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __call__(self, text):
+        """Get the parsed doc for text, parsing it if not already cached"""
+        doc = self._docs.get(text)
+        if doc is None:
+            doc = self.nlp(text)
+            self._docs[text] = doc
+        return doc
+
+    def entities(self, text):
+        """Get the (text, label) named entities found in text"""
+        entities = self._entities.get(text)
+        if entities is None:
+            entities = [(X.text, X.label_) for X in self(text).ents]
+            self._entities[text] = entities
+        return entities
+
+    def pipe(self, texts, batch_size=NLP_BATCH_SIZE, n_process=1):
+        """Parse all texts not already cached, in batches"""
+        texts = [
+            text
+            for text in dict.fromkeys(texts)
+            if isinstance(text, str) and text not in self._docs
+        ]
+        docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        for (text, doc) in zip(texts, docs):
+            self._docs[text] = doc
+        return len(texts)
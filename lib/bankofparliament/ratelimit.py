@@ -0,0 +1,146 @@
+"""
+Module for per host request rate limiting and retry backoff
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import time
+import random
+import threading
+import email.utils
+import urllib.parse
+
+# local libs
+from .constants import (
+    RECONCILE_HOST_LIMITS,
+    REQUEST_BACKOFF_BASE,
+    REQUEST_WAIT_TIME,
+)
+
+
+class TokenBucket:
+    """Token bucket, refilled at rate tokens per second up to capacity"""
+
+    def __init__(self, rate, capacity=1):
+        """Initialise a full bucket"""
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """Add the tokens accrued since the last update"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def reserve(self):
+        """Take a token, returns the seconds to wait before it may be used"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """Drain the bucket so the next token is available in seconds"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, -seconds * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """Block until a token is available, returns the seconds waited"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class ThrottleMetrics:
+    """Per host counters of throttled time and retries"""
+
+    def __init__(self):
+        """Initialise empty counters"""
+        self.lock = threading.Lock()
+        self.throttled = {}
+        self.retries = {}
+        self.backoff = {}
+
+    def add_throttled(self, host, seconds):
+        """Record time spent waiting on the host's token bucket"""
+        if seconds > 0:
+            with self.lock:
+                self.throttled[host] = self.throttled.get(host, 0.0) + seconds
+
+    def add_retry(self, host, seconds):
+        """Record a refused request and the backoff before its retry"""
+        with self.lock:
+            self.retries[host] = self.retries.get(host, 0) + 1
+            self.backoff[host] = self.backoff.get(host, 0.0) + seconds
+
+    def log(self, logger):
+        """Log the counters for every host that was throttled or retried"""
+        for host in sorted(set(self.throttled) | set(self.retries)):
+            logger.info(
+                "Throttled {}: {:.1f}s rate limited, {} retries, {:.1f}s backoff".format(
+                    host,
+                    self.throttled.get(host, 0.0),
+                    self.retries.get(host, 0),
+                    self.backoff.get(host, 0.0),
+                )
+            )
+
+
+metrics = ThrottleMetrics()
+buckets = {}
+buckets_lock = threading.Lock()
+
+
+def get_host(url):
+    """Get the host name of a url"""
+    return urllib.parse.urlparse(url).hostname
+
+
+def get_bucket(host, host_limits=None):
+    """Get the shared token bucket of a host, None for hosts without a quota"""
+    host_limits = host_limits or RECONCILE_HOST_LIMITS
+    if host not in host_limits:
+        return None
+
+    with buckets_lock:
+        if host not in buckets:
+            (concurrency, rate) = host_limits[host]
+            buckets[host] = TokenBucket(rate, capacity=concurrency)
+        return buckets[host]
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, in seconds or http date form"""
+    if not value:
+        return None
+
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date is None:
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Capped exponential backoff with jitter, at least any Retry-After given"""
+    delay = min(REQUEST_WAIT_TIME, REQUEST_BACKOFF_BASE * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, REQUEST_WAIT_TIME))
+    return delay
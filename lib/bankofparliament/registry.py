@@ -0,0 +1,336 @@
+"""
+Module for indexed entity and relationship storage used during extraction
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import itertools
+from collections import deque
+
+# third party libs
+import pandas
+
+# local libs
+from .constants import ENTITY_TEMPLATE
+
+# an alias matches text when followed by one of these, wherever it starts
+ALIAS_CLOSING_CHARS = ').;,"'
+# or when at the start, or after a space, and followed by one of these
+ALIAS_SPACED_CLOSING_CHARS = ("", " ", "'", "’")
+
+ALIAS_IN_PATTERNS = [
+    " {} ",
+    " {},",
+    " {}.",
+    " {};",
+    " {}'",
+    " {}’",
+    "{})",
+    "{};",
+    "{}.",
+    "{},",
+    '{}"',
+]
+
+
+def alias_in_text(text, alias):
+    """Check text for an exact, prefix, suffix or delimited occurance of alias"""
+    if text == alias:
+        return True
+    if text.startswith("{} ".format(alias)) or text.endswith(" {}".format(alias)):
+        return True
+    return any(pattern.format(alias) in text for pattern in ALIAS_IN_PATTERNS)
+
+
+def alias_is_delimited(text, start, end):
+    """Check an occurance of an alias at text[start:end] satisfies alias_in_text"""
+    after = text[end : end + 1]
+    if after and after in ALIAS_CLOSING_CHARS:
+        return True
+    if start == 0:
+        return after in ("", " ")
+    return text[start - 1] == " " and after in ALIAS_SPACED_CLOSING_CHARS
+
+
+class AliasAutomaton:
+    """
+    Aho-Corasick automaton finding all occurances of many aliases in one pass
+    over a text. Aliases added after the build are searched for directly,
+    until there are enough of them to rebuild
+    """
+
+    REBUILD_THRESHOLD = 64
+
+    def __init__(self, aliases=()):
+        """Build the automaton for the aliases"""
+        self._aliases = set(alias for alias in aliases if alias)
+        self._pending = set()
+        self.build()
+
+    def __len__(self):
+        return len(self._aliases) + len(self._pending)
+
+    def add(self, alias):
+        """Add an alias, rebuilding once enough are pending"""
+        if not alias or alias in self._aliases:
+            return
+
+        self._pending.add(alias)
+        if len(self._pending) > self.REBUILD_THRESHOLD:
+            self._aliases.update(self._pending)
+            self._pending = set()
+            self.build()
+
+    def build(self):
+        """Build the goto, failure and output tables"""
+        self._goto = [{}]
+        self._outputs = [[]]
+
+        for alias in self._aliases:
+            state = 0
+            for char in alias:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._outputs.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._outputs[state].append(alias)
+
+        # breadth first, so failure states are complete before they are used
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for (char, next_state) in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                )
+
+    def search(self, text):
+        """Yield (start, end, alias) for every occurance of an alias in text"""
+        state = 0
+        for (index, char) in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for alias in self._outputs[state]:
+                yield (index + 1 - len(alias), index + 1, alias)
+
+        for alias in self._pending:
+            start = text.find(alias)
+            while start != -1:
+                yield (start, start + len(alias), alias)
+                start = text.find(alias, start + 1)
+
+
+class EntityRegistry:
+    """Entity records indexed by lowercase name and entity type"""
+
+    def __init__(self, columns=None):
+        """Initialise an empty registry"""
+        self._columns = list(columns) if columns is not None else list(ENTITY_TEMPLATE)
+        self._records = []
+        self._names = {}
+        self._types = {}
+        self._aliases = {}
+        self._automaton = None
+
+    @classmethod
+    def from_dataframe(cls, dataframe):
+        """Build a registry from an entities dataframe"""
+        registry = cls(columns=dataframe.columns)
+        for record in dataframe.to_dict(orient="records"):
+            registry.append(record)
+        return registry
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def append(self, entity):
+        """Add a new entity record, without checking for an existing name"""
+        record = dict(entity)
+        for key in record:
+            if key not in self._columns:
+                self._columns.append(key)
+
+        position = len(self._records)
+        self._records.append(record)
+        self._names.setdefault(str(record["name"]).lower(), []).append(position)
+        self._types.setdefault(record["entity_type"], []).append(position)
+        self._index_aliases(position)
+        return record
+
+    def _split_aliases(self, position):
+        """Normalised aliases of the record at position"""
+        aliases = self._records[position].get("aliases")
+        if not isinstance(aliases, str):
+            return []
+        return [alias.strip().lower() for alias in aliases.split(";")]
+
+    def _index_aliases(self, position):
+        """Index the aliases of the record at position"""
+        for alias in self._split_aliases(position):
+            self._aliases.setdefault(alias, set()).add(position)
+            if self._automaton is not None:
+                self._automaton.add(alias)
+
+    def positions(self, name, exact=False):
+        """
+        Positions of all records matching the name, case insensitive unless
+        exact is set
+        """
+        positions = self._names.get(str(name).lower(), [])
+        if exact:
+            return [
+                position
+                for position in positions
+                if self._records[position]["name"] == name
+            ]
+        return positions
+
+    def exists(self, name, exact=False):
+        """Check if entity name already exists, case insensitive unless exact"""
+        return bool(self.positions(name, exact=exact))
+
+    def find(self, name):
+        """All records matching the name, case insensitive"""
+        return [self._records[position] for position in self.positions(name)]
+
+    def get(self, name):
+        """First record matching the name, case insensitive"""
+        positions = self.positions(name)
+        if positions:
+            return self._records[positions[0]]
+        return None
+
+    def get_entity_type(self, name):
+        """Get the entity type from the name"""
+        record = self.get(name)
+        if record:
+            return record["entity_type"]
+        return None
+
+    def merge_aliases(self, name, aliases, exact=False):
+        """Merge aliases into every record matching the name, returns True if changed"""
+        positions = self.positions(name, exact=exact)
+        if not positions:
+            return False
+
+        existing_aliases = self._records[positions[0]]["aliases"].split(";")
+        updated_aliases = list(dict.fromkeys(existing_aliases + list(aliases)))
+        if updated_aliases == existing_aliases:
+            return False
+
+        for position in positions:
+            self.set_aliases(position, updated_aliases)
+        return True
+
+    def set_aliases(self, position, aliases):
+        """Replace the aliases of the record at position"""
+        for alias in self._split_aliases(position):
+            self._aliases[alias].discard(position)
+        self._records[position]["aliases"] = ";".join(aliases)
+        self._index_aliases(position)
+
+    def by_type(self, entity_types):
+        """Records of the given entity types, in registry order"""
+        positions = itertools.chain.from_iterable(
+            self._types.get(entity_type, []) for entity_type in set(entity_types)
+        )
+        return [self._records[position] for position in sorted(positions)]
+
+    def find_aliases(self, text, entity_types):
+        """
+        Records of the given entity types with an alias in text, as defined
+        by alias_in_text, in registry order
+        """
+        if self._automaton is None:
+            self._automaton = AliasAutomaton(self._aliases)
+
+        positions = set()
+        for (start, end, alias) in self._automaton.search(text):
+            if alias_is_delimited(text, start, end):
+                positions.update(self._aliases.get(alias, ()))
+
+        # an empty alias has an occurance everywhere, check it directly
+        if self._aliases.get("") and alias_in_text(text, ""):
+            positions.update(self._aliases[""])
+
+        entity_types = set(entity_types)
+        return [
+            self._records[position]
+            for position in sorted(positions)
+            if self._records[position]["entity_type"] in entity_types
+        ]
+
+    def to_dataframe(self):
+        """Materialise the registry as a dataframe"""
+        return pandas.DataFrame(self._records, columns=self._columns)
+
+
+class RelationshipBuffer:
+    """Append only, columnar store of relationship rows"""
+
+    def __init__(self, columns=None):
+        """Initialise an empty buffer"""
+        columns = list(columns) if columns is not None else []
+        self._columns = {column: [] for column in columns}
+        self._length = 0
+        self._siblings = {}
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def append(self, relationship):
+        """Append a relationship row"""
+        for key in relationship:
+            if key not in self._columns:
+                self._columns[key] = [None] * self._length
+
+        for (key, values) in self._columns.items():
+            values.append(relationship.get(key, None))
+
+        sibling_key = (
+            str(relationship.get("source")).lower(),
+            str(relationship.get("relationship_type")).lower(),
+        )
+        self._siblings.setdefault(sibling_key, []).append(self._length)
+        self._length += 1
+
+    def row(self, position):
+        """Get the relationship row at position"""
+        return {key: values[position] for (key, values) in self._columns.items()}
+
+    def last(self):
+        """Get the most recently appended relationship row"""
+        if self._length:
+            return self.row(-1)
+        return None
+
+    def siblings(self, source, relationship_type):
+        """Rows matching source and relationship type, most recent first"""
+        positions = self._siblings.get(
+            (str(source).lower(), str(relationship_type).lower()), []
+        )
+        return [self.row(position) for position in reversed(positions)]
+
+    def to_dataframe(self):
+        """Materialise the buffer as a dataframe"""
+        return pandas.DataFrame(self._columns, columns=list(self._columns))
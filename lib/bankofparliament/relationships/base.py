@@ -45,6 +45,24 @@ class BaseRelationship:
     ]
     EXCLUDE_FROM_SEARCHING = ["solicitor"]
 
+    # (endpoint, params) requested by each find_*_from_text method, the
+    # organisation endpoint is the findthatcharity, opencorporates then
+    # companies house chain of find_organisation_by_name
+    RECONCILE_QUERIES = {
+        "company": ("opencorporates", {"jurisdiction": "gb"}),
+        "charity": ("findthatcharity", {"end_point": "registered-charity"}),
+        "health": ("findthatcharity", {"end_point": "health"}),
+        "university": ("findthatcharity", {"end_point": "university"}),
+        "education": ("findthatcharity", {"end_point": "education"}),
+        "government_organisation": (
+            "findthatcharity",
+            {"end_point": "government-organisation"},
+        ),
+        "local_authority": ("findthatcharity", {"end_point": "local_authority"}),
+        "findthatcharity": ("findthatcharity", {"end_point": "all"}),
+        "organisation": ("organisation", {}),
+    }
+
     recurring_payment_regex = re.compile(
         r"({}).+".format("|".join(RECURRING_INDICATORS).lower())
     )
@@ -142,6 +160,24 @@ class BaseRelationship:
         Find entity in self.text
         """
 
+    def get_reconcile_queries(self):
+        """
+        Reconcile queries solve() may request, as (endpoint, query, params)
+        tuples, used to prefetch reconcile responses before solving
+        """
+        return []
+
+    def get_reconcile_query(self, finder, text):
+        """The reconcile query requested by a find_{finder}_from_text call"""
+        if finder == "organisation":
+            try:
+                text = eval_string_as_list(text)[0]
+            except:
+                text = text
+
+        (endpoint, params) = self.RECONCILE_QUERIES[finder]
+        return (endpoint, text, params)
+
     def update_relationship(self):
         """
         Update the relationship with extracted info
@@ -153,8 +189,7 @@ class BaseRelationship:
 
     def extract_date_from_text(self, text):
         """Extract date from text"""
-        result = self.nlp(text)
-        entities = [(X.text, X.label_) for X in result.ents]
+        entities = self.nlp.entities(text)
         for entity in entities:
             if entity[1] in ["DATE"]:
                 return entity[0]
@@ -162,8 +197,7 @@ class BaseRelationship:
 
     def extract_amount_from_text(self, text):
         """Extract monetary amount from text"""
-        result = self.nlp(text)
-        entities = [(X.text, X.label_) for X in result.ents]
+        entities = self.nlp.entities(text)
         amounts = []
         for entity in entities:
             if entity[1] in ["MONEY"]:
@@ -210,7 +244,7 @@ class BaseRelationship:
                     self.relationship["source"], self.relationship["relationship_type"]
                 )
 
-                for (_index, rel) in sources_relationships.iterrows():
+                for rel in sources_relationships:
                     if rel["target"] != "UNKNOWN" and rel["recurring"]:
                         self.logger.debug(
                             "{}: {}".format(
@@ -219,11 +253,7 @@ class BaseRelationship:
                             )
                         )
 
-                        filt = (
-                            self.entities["name"].str.lower() == rel["target"].lower()
-                        )
-                        match = self.entities.loc[filt]
-                        entity_type = match.iloc[0]["entity_type"]
+                        entity_type = self.entities.get_entity_type(rel["target"])
 
                         entity = make_entity_dict(
                             entity_type=entity_type,
@@ -240,10 +270,7 @@ class BaseRelationship:
 
     def find_profession_from_text(self, text):
         """Find a profession within text"""
-        filt = self.entities["entity_type"] == "profession"
-        professions = self.entities.loc[filt]
-
-        for (_index, row) in professions.iterrows():
+        for row in self.entities.by_type(["profession"]):
             if row["name"].lower() in text.lower():
                 entity = make_entity_dict(
                     entity_type="profession",
@@ -270,10 +297,7 @@ class BaseRelationship:
 
     def find_property_from_text(self, text):
         """Find a property within text"""
-        filt = self.entities["entity_type"] == "property"
-        properties = self.entities.loc[filt]
-
-        for (_index, row) in properties.iterrows():
+        for row in self.entities.by_type(["property"]):
             if row["name"].lower() in text.lower():
                 entity = make_entity_dict(
                     entity_type="property",
@@ -300,8 +324,7 @@ class BaseRelationship:
 
     def find_ner_type_from_text(self, text, target_entity_type):
         """Find NER types within text"""
-        result = self.nlp(text)
-        entities = [(X.text, X.label_) for X in result.ents]
+        entities = self.nlp.entities(text)
 
         for entity in entities:
             if entity[1] in self.NER_TYPES:
@@ -581,9 +604,7 @@ class BaseRelationship:
             text=text,
         )
         if alias:
-            filt = self.entities["name"].str.lower() == alias.lower()
-            match = self.entities.loc[filt]
-            alias_type = match.iloc[0]["entity_type"]
+            alias_type = self.entities.get_entity_type(alias)
 
             entity = make_entity_dict(
                 entity_type=alias_type,
@@ -606,80 +627,27 @@ class BaseRelationship:
                 text, entity_types, prefered_entity_types
             )
         )
-        dataframe = self.entities
-        filt = dataframe["entity_type"].isin(entity_types)
-        dataframe = dataframe[filt]
-
-        _aliases = []
-        for name, aliases, etype in zip(
-            dataframe["name"], dataframe["aliases"], dataframe["entity_type"]
-        ):
-            for alias in aliases.split(";"):
-                alias = alias.strip().lower()
-
-                # does the word match exactly
-                if text == alias:
-                    if prefered_entity_types:
-                        _aliases.append((etype, name.upper()))
-                    else:
-                        return name.upper()
-
-                # does the word exist at the start of the string, with a space following
-                start_alias = "{} ".format(alias)
-                if text.startswith(start_alias):
-                    if prefered_entity_types:
-                        _aliases.append((etype, name.upper()))
-                    else:
-                        return name.upper()
-
-                # does the word exist at the end of the string, precedding with a space
-                end_alias = " {}".format(alias)
-                if text.endswith(end_alias):
-                    if prefered_entity_types:
-                        _aliases.append((etype, name.upper()))
-                    else:
-                        return name.upper()
-
-                in_patterns = [
-                    " {} ",
-                    " {},",
-                    " {}.",
-                    " {};",
-                    " {}'",
-                    " {}’",
-                    "{})",
-                    "{};",
-                    "{}.",
-                    "{},",
-                    '{}"',
-                ]
-                # does the pattern exist in the text
-                for _pattern in in_patterns:
-                    pattern = _pattern.format(alias)
-                    if pattern in text:
-                        if prefered_entity_types:
-                            _aliases.append((etype, name.upper()))
-                        else:
-                            return name.upper()
-
-        if prefered_entity_types and _aliases:
-            best_match = None
-            for (_alias_type, _alias_name) in _aliases:
-                if _alias_type in prefered_entity_types:
-                    best_match = _alias_name
-            if best_match:
-                return best_match
-            return _aliases[0][1]
-
-        return None
+        matches = self.entities.find_aliases(text, entity_types)
+        if not matches:
+            return None
+
+        # the last match of a prefered type, otherwise the first match
+        if prefered_entity_types:
+            prefered = [
+                entity
+                for entity in matches
+                if entity["entity_type"] in prefered_entity_types
+            ]
+            if prefered:
+                return prefered[-1]["name"].upper()
+        return matches[0]["name"].upper()
 
     def get_nlp_entities_from_text(self, text, entity_types=None):
         """"""
         if not entity_types:
             entity_types = self.NER_TYPES
 
-        result = self.nlp(text=text)
-        entities = [(X.text, X.label_) for X in result.ents]
+        entities = self.nlp.entities(text)
         nlp_names = []
         for entity in entities:
             if entity[1] in entity_types:
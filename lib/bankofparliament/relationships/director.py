@@ -64,6 +64,14 @@ class Directorship(TextRelationship):
 
         self.text = text
 
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        return [
+            self.get_reconcile_query("organisation", name)
+            for name in self.names_to_try
+            if name.lower() not in self.EXCLUDE_FROM_SEARCHING
+        ]
+
     def solve(self):
         """Find entity in text"""
         self.date = self.extract_date_from_text(self.relationship["text"])
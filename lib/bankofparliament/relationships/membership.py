@@ -15,11 +15,9 @@ class Membership(TextRelationship):
 
     def solve(self):
         """Find entity in text"""
-        filt = (
-            self.parent._extracted_entities["name"].str.lower()
-            == self.relationship["target"].lower()
+        target_entity = self.parent._extracted_entities.find(
+            self.relationship["target"]
         )
-        target_entity = self.parent._extracted_entities.loc[filt]
-        for (_index, row) in target_entity.iterrows():
-            entity = row.to_dict()
+        for row in target_entity:
+            entity = dict(row)
             self.extracted_entities.append(entity)
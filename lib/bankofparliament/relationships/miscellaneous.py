@@ -109,6 +109,21 @@ class Miscellaneous(TextRelationship):
         self.logger.debug("Guesses: {}".format(self.guess_types))
         self.logger.debug("Names: {}".format(self.names_to_try))
 
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        queries = [
+            self.get_reconcile_query(guess, name)
+            for guess in self.guess_types
+            for name in self.names_to_try
+            if guess in self.RECONCILE_QUERIES
+        ]
+        queries.extend(
+            self.get_reconcile_query("organisation", name)
+            for name in self.names_to_try
+            if name.lower() not in self.EXCLUDE_FROM_SEARCHING
+        )
+        return queries
+
     def solve(self):
         """Find entity in text"""
         self.date = self.extract_date_from_text(self.relationship["text"])
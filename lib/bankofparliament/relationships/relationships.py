@@ -124,6 +124,18 @@ class CompoundRelationship(BaseRelationship):
 
         self.text = data
 
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        finder = {
+            "company": "company",
+            "charity": "charity",
+            "association": "organisation",
+            "misc": "organisation",
+        }.get(self.entity_type)
+        if not finder:
+            return []
+        return [self.get_reconcile_query(finder, entry) for entry in self._entries]
+
     def get_entity_type_from_status(self):
         """Find the entity from the status key"""
 
@@ -61,6 +61,10 @@ class Shareholder(TextRelationship):
         text = self.run_replace(text)
         self.text = text
 
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        return [self.get_reconcile_query("organisation", self.text)]
+
     def solve(self):
         """Find entity in text"""
         self.date = self.extract_date_from_text(self.relationship["text"])
@@ -3,12 +3,9 @@ Module for significant relationship
 """
 # -*- coding: utf-8 -*-
 
-# sys libs
-import re
-
 # local libs
 from .relationships import TextRelationship
-from ..patterns import IN_PARENTHESIS
+from ..text import IN_PARENTHESIS_REGEX
 from ..constants import OTHER_ENTITIES
 
 
@@ -22,12 +19,7 @@ class SignificationControl(TextRelationship):
         """Clean the text prior to solving"""
         text = self.text
 
-        regex_pattern = ""
-        for item in IN_PARENTHESIS:
-            regex_pattern += r"\(.*{}.*\)|".format(item)
-        regex_pattern = "({})".format(regex_pattern[:-1])
-
-        match = re.search(regex_pattern, text)
+        match = IN_PARENTHESIS_REGEX.search(text)
         if match:
             groups = match.groups()
             for grp in groups:
@@ -36,6 +28,10 @@ class SignificationControl(TextRelationship):
         text = self.run_replace(text)
         self.text = text
 
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        return [self.get_reconcile_query("organisation", self.text)]
+
     def solve(self):
         """Find entity in text"""
         self.date = self.extract_date_from_text(self.relationship["text"])
@@ -34,19 +34,28 @@ class Sponsorship(TextRelationship):
             self.extracted_entities.append(entity)
             return
 
-        result = self.nlp(self.text)
-        entities = [(X.text, X.label_) for X in result.ents]
-
-        for entity in entities:
+        for entity_name in self.get_organisation_names():
+            entity = self.find_organisation_from_text(text=entity_name)
+            if entity:
+                self.extracted_entities.append(entity)
+                return
+
+    def get_organisation_names(self):
+        """Organisation names found by the nlp model, without starters"""
+        names = []
+        for entity in self.nlp.entities(self.text):
             if entity[1] == "ORG":
                 entity_name = entity[0]
 
                 for starter in self.STARTERS:
                     if entity_name.lower().startswith(starter):
                         entity_name = entity_name[len(starter) :]
-                entity_name = entity_name.strip()
-
-                entity = self.find_organisation_from_text(text=entity_name)
-                if entity:
-                    self.extracted_entities.append(entity)
-                    return
+                names.append(entity_name.strip())
+        return names
+
+    def get_reconcile_queries(self):
+        """Reconcile queries solve() may request"""
+        return [
+            self.get_reconcile_query("organisation", name)
+            for name in self.get_organisation_names()
+        ]
@@ -20,6 +20,38 @@ from nltk import word_tokenize
 
 terms = prepare_terms()
 
+# compiled patterns, built once and shared by the cleanup helpers
+IN_PARENTHESIS_REGEX = re.compile(
+    "({})".format("|".join(r"\(.*{}.*\)".format(item) for item in IN_PARENTHESIS))
+)
+POSITIONS_PATTERN = ",? |".join(sorted(POSITIONS, key=len, reverse=True))
+POSITIONS_REGEX = re.compile(POSITIONS_PATTERN)
+POSITIONS_IGNORECASE_REGEX = re.compile(POSITIONS_PATTERN, flags=re.IGNORECASE)
+FROM_UNTIL_REGEX = re.compile("(Until [a-zA-Z0-9 ]+,)|(From [a-zA-Z0-9 ]+,)")
+FROM_UNTIL_IGNORECASE_REGEX = re.compile(
+    "(until [a-zA-Z0-9 ]+,)|(from [a-zA-Z0-9 ]+,)", flags=re.IGNORECASE
+)
+CATEGORY_REGEXES = [
+    re.compile(r"(\(?see category [0-9]+\(?[a-z]?\)?\))", flags=re.IGNORECASE)
+]
+REGISTERED_REGEXES = [
+    re.compile(r"(\(Registered.*\))", flags=re.IGNORECASE),
+    re.compile(r"(\(Updated.*\))", flags=re.IGNORECASE),
+]
+SHARE_CLASS_REGEXES = [
+    re.compile(
+        r"(Ord[inary]?[ 0-9a-zA-Z]+Shares? ?[0-9\(.,:;%\)]+)", flags=re.IGNORECASE
+    ),
+    re.compile(r"({}).+".format("|".join(FINANCIAL_SUFFIXES)), flags=re.IGNORECASE),
+]
+CAPITALS_IN_PARENTHESIS_REGEX = re.compile(r"(\([A-Z0-9 ]{2,}\))")
+IN_PARENTHESIS_TEXT_REGEX = re.compile(r"(\([^(^)]+\)?)")
+REGISTRATION_SPLIT_REGEX = re.compile("registration |registration number ")
+COMPANIES_HOUSE_NUMBER_REGEX = re.compile(
+    "([{}|0-9]+)".format("|".join(COMPANIES_HOUSE_PREFIXES))
+)
+NON_ALPHANUMERIC_REGEX = re.compile(r"[\W_]")
+
 
 def eval_string_as_list(string_list):
     """Eval the string to list"""
@@ -37,12 +69,7 @@ def clean_up_significant_control(text):
         Prowear 1863 to 1934 Ltd (dormant company) >>> Prowear 1863 to 1934 Ltd
         Step Foundation (interest ceased 10 December 2019) >>> Step Foundation
     """
-    regex_pattern = ""
-    for item in IN_PARENTHESIS:
-        regex_pattern += r"\(.*{}.*\)|".format(item)
-    regex_pattern = "({})".format(regex_pattern[:-1])
-
-    match = re.search(regex_pattern, text)
+    match = IN_PARENTHESIS_REGEX.search(text)
     if match:
         groups = match.groups()
         for grp in groups:
@@ -61,8 +88,7 @@ def clean_up_directorship(text):
     text = strip_category_text(text)
 
     # Remove ay positions from text, chairman, director etc
-    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
-    text = re.sub(pattern, "", text)
+    text = POSITIONS_REGEX.sub("", text)
 
     parenthesis_match = find_text_within_parenthesis_excluding_other_parenthesis(text)
     if parenthesis_match:
@@ -90,8 +116,7 @@ def clean_up_shareholder(text):
     text = strip_registered_text(text)
 
     # Remove ay positions from text, chairman, director etc
-    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
-    text = re.sub(pattern, "", text)
+    text = POSITIONS_REGEX.sub("", text)
 
     parenthesis_match = find_text_within_parenthesis_excluding_other_parenthesis(text)
     if parenthesis_match:
@@ -133,8 +158,7 @@ def clean_up_shareholder(text):
         if text.endswith(ender):
             text = text[: len(ender)]
 
-    from_until_pattern = "(Until [a-zA-Z0-9 ]+,)|(From [a-zA-Z0-9 ]+,)"
-    match = re.search(from_until_pattern, text)
+    match = FROM_UNTIL_REGEX.search(text)
     if match:
         grps = match.group()
         text = text.replace(grps, "")
@@ -150,9 +174,8 @@ def strip_category_text(text):
          '(see category 1)'
          '(see category 4(a))'
     """
-    patterns = [r"(\(?see category [0-9]+\(?[a-z]?\)?\))"]
-    for pattern in patterns:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
+    for regex in CATEGORY_REGEXES:
+        match = regex.search(text)
         if match:
             grps = match.groups()
             for grp in grps:
@@ -166,9 +189,8 @@ def strip_registered_text(text):
     Examples:
          'Millgap Ltd; consulting, advisory and investment (Registered 05 June 2015)'
     """
-    patterns = [r"(\(Registered.*\))", r"(\(Updated.*\))"]
-    for pattern in patterns:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
+    for regex in REGISTERED_REGEXES:
+        match = regex.search(text)
         if match:
             grps = match.groups()
             for grp in grps:
@@ -179,15 +201,13 @@ def strip_registered_text(text):
 def strip_positions_text(text):
     """Remove a job title from text"""
     # Remove ay positions from text, chairman, director etc
-    pattern = "{}".format(",? |".join(sorted(POSITIONS, key=len, reverse=True)))
-    text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+    text = POSITIONS_IGNORECASE_REGEX.sub("", text)
     return text
 
 
 def strip_from_dates_text(text):
     """Remove dates from text"""
-    from_until_pattern = "(until [a-zA-Z0-9 ]+,)|(from [a-zA-Z0-9 ]+,)"
-    match = re.search(from_until_pattern, text, flags=re.IGNORECASE)
+    match = FROM_UNTIL_IGNORECASE_REGEX.search(text)
     if match:
         grps = match.groups()
         for grp in grps:
@@ -220,13 +240,8 @@ def strip_parenthesis_text(text):
 
 def strip_share_class(nlp, text):
     """"""
-    patterns = [
-        r"(Ord[inary]?[ 0-9a-zA-Z]+Shares? ?[0-9\(.,:;%\)]+)",
-        r"({}).+".format("|".join(FINANCIAL_SUFFIXES)),
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
+    for regex in SHARE_CLASS_REGEXES:
+        match = regex.search(text)
         if match:
             grps = match.groups()
             for grp in grps:
@@ -251,8 +266,7 @@ def has_consecutive_capital_letters_within_parenthesis(text):
         'A company (UK) Ltd' - keep this
         'A company (agriculture)' - drop this
     """
-    pattern = r"(\([A-Z0-9 ]{2,}\))"
-    match = re.search(pattern, text)
+    match = CAPITALS_IN_PARENTHESIS_REGEX.search(text)
     if match:
         return True
     return False
@@ -264,8 +278,7 @@ def find_text_within_parenthesis_excluding_other_parenthesis(text):
     Examples:
         'Director, The Big Issue Cymru Limited (Wales edition of Big Issue magazine)
     """
-    pattern = r"(\([^(^)]+\)?)"
-    match = re.findall(pattern, text)
+    match = IN_PARENTHESIS_TEXT_REGEX.findall(text)
     return match
 
 
@@ -274,13 +287,12 @@ def extract_company_registration_number_from_text(text, logger):
     Regex for companies house number
     """
     text = (
-        re.split("registration |registration number ", text)[-1]
+        REGISTRATION_SPLIT_REGEX.split(text)[-1]
         .strip()
         .replace(" ", "")
     )
 
-    companies_house_pattern = "([{}|0-9]+)".format("|".join(COMPANIES_HOUSE_PREFIXES))
-    match = re.search(companies_house_pattern, text)
+    match = COMPANIES_HOUSE_NUMBER_REGEX.search(text)
     if match:
         company_number = match.groups()[0].zfill(8)
         logger.debug("Found companies house number: {}".format(company_number))
@@ -356,7 +368,7 @@ def strip_stopwords(text):
 
 def strip_non_alphanumeric(text):
     """"""
-    return re.sub("[\W_]", "", text)
+    return NON_ALPHANUMERIC_REGEX.sub("", text)
 
 
 def result_matches_query(name, query, logger, min_word_length=2):
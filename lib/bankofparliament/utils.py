@@ -4,15 +4,19 @@ Module for utils
 # -*- coding: utf-8 -*-
 
 # sys libs
+import os
 import re
 import time
+import shutil
 import json
+import hashlib
 import logging
 import operator
 import urllib.parse
 import urllib.request
 
 # third party libs
+import ijson
 import pandas
 import requests
 import tabula
@@ -22,10 +26,11 @@ from bs4 import BeautifulSoup
 # local libs
 from .constants import (
     HEADERS,
-    REQUEST_WAIT_TIME,
+    REQUEST_MAX_RETRIES,
     TRADE_UNIONS_URL,
     COMPANIES_HOUSE_QUERY_URL,
     QUERY_LIMIT,
+    RECONCILE_BATCH_SIZE,
     COMPANIES_HOUSE_SEARCH_URL,
     OPENCORPORATES_RECONCILE_URL,
     OPENCORPORATES_RECONCILE_FLYOUT_URL,
@@ -33,13 +38,19 @@ from .constants import (
     COLOR_CODES,
     ENTITY_TEMPLATE,
     RELATIONSHIP_TEMPLATE,
+    PDF_TABLE_OPTIONS,
+    PDF_TABLE_CACHE_DIR,
 )
 
+from . import ratelimit
 from .text import result_matches_query
 
 # global requests session
 session = requests.Session()
 
+# global reconcile response cache, see set_reconcile_cache
+reconcile_cache = None
+
 
 def get_logger(name, debug=False):
     """General purpose logger"""
@@ -72,61 +83,131 @@ def color_command(color):
 
 
 def get_request(url, logger, user=None, headers=None, params=None):
-    """General purpose url requests"""
+    """
+    General purpose url requests, rate limited per host. Refused requests
+    are retried with backoff, honouring any Retry-After header
+    """
     if not headers:
         headers = {}
     if not params:
         params = {}
-    if user:
-        request = session.get(url, auth=(user, ""), headers=headers, params=params)
-    else:
-        request = session.get(url, headers=headers, params=params)
-
-    # successfull request
-    if request.status_code == 200:
-        return request
-
-    # too many requests
-    if request.status_code == 429:
+    auth = (user, "") if user else None
+    host = ratelimit.get_host(url)
+    bucket = ratelimit.get_bucket(host)
+
+    for attempt in range(REQUEST_MAX_RETRIES + 1):
+        if bucket:
+            ratelimit.metrics.add_throttled(host, bucket.acquire())
+        request = session.get(url, auth=auth, headers=headers, params=params)
+
+        # successfull request
+        if request.status_code == 200:
+            return request
+
+        # too many requests or temporarily unavailable
+        if request.status_code not in [429, 503] or attempt == REQUEST_MAX_RETRIES:
+            break
+
+        retry_after = ratelimit.parse_retry_after(request.headers.get("Retry-After"))
+        delay = ratelimit.backoff_delay(attempt, retry_after)
+        if bucket:
+            bucket.pause(delay)
+        ratelimit.metrics.add_retry(host, delay)
         logger.warning(
-            "Too Many Requests, wait for {} seconds".format(REQUEST_WAIT_TIME)
-        )
-        time.sleep(REQUEST_WAIT_TIME)
-        return get_request(url, logger, user, headers)
-
-    # temporarily unavailable
-    if request.status_code == 503:
-        logger.warning(
-            "Temporarily Unavailable, wait for {} seconds".format(REQUEST_WAIT_TIME)
+            "Request refused ({}), retry {}/{} in {:.1f} seconds".format(
+                request.status_code, attempt + 1, REQUEST_MAX_RETRIES, delay
+            )
         )
-        time.sleep(REQUEST_WAIT_TIME)
-        return get_request(url, logger, user, headers)
+        time.sleep(delay)
 
+    logger.debug("Request failed ({}): {}".format(request.status_code, url))
     return None
 
 
+############################################################################
+# cache functions
+def set_reconcile_cache(cache):
+    """Set the cache used by the reconcile, finder and search functions"""
+    global reconcile_cache
+    reconcile_cache = cache
+
+
+def cached_fetch(endpoint, query, fetch_function, params=None):
+    """Call fetch_function, via the reconcile cache when one is set"""
+    if reconcile_cache is None:
+        return fetch_function()
+    return reconcile_cache.fetch(endpoint, query, fetch_function, params=params)
+
+
+def reconcile_cache_get(endpoint, query, params=None):
+    """Get a cached response, None if missing or no cache is set"""
+    if reconcile_cache is None:
+        return None
+    response = reconcile_cache.get(endpoint, query, params)
+    if response is reconcile_cache.MISSING:
+        return None
+    return response
+
+
+def reconcile_cache_set(endpoint, query, response, params=None):
+    """Store a response, if a cache is set"""
+    if reconcile_cache is not None:
+        reconcile_cache.set(endpoint, query, response, params)
+
+
+def chunks(items, size):
+    """Split a list into lists of at most size items"""
+    size = max(1, size)
+    return [items[index : index + size] for index in range(0, len(items), size)]
+
+
 ############################################################################
 # reconcile functions
+def reconcile_query_params(name, limit=QUERY_LIMIT, jurisdiction=None):
+    """
+    Reconcile request parameters for a single name query, or for a list of
+    names as queries q0..qN
+    """
+    names = name if isinstance(name, list) else [name]
+    query = {
+        "q{}".format(index): {"query": _name, "limit": limit}
+        for (index, _name) in enumerate(names)
+    }
+    _query = json.dumps(query)
+    if jurisdiction:
+        return {"queries": [_query], "jurisdiction_code": jurisdiction}
+    return {"queries": [_query]}
+
+
 def reconcile_opencorporates_entity_by_name(
     name, logger, jurisdiction="gb", limit=QUERY_LIMIT
 ):
     """Reconcile a company name to an opencorporates record"""
     logger.debug("reconcile_opencorporates_entity_by_name: {}".format(name))
-    query = {"q0": {"query": name, "limit": limit}}
-    _query = json.dumps(query)
-    if jurisdiction:
-        params = {"queries": [_query], "jurisdiction_code": jurisdiction}
-    else:
-        params = {"queries": [_query]}
-
-    request = get_request(
-        OPENCORPORATES_RECONCILE_URL, logger, user=None, headers=HEADERS, params=params
+    params = reconcile_query_params(name, limit, jurisdiction)
+
+    def _fetch():
+        request = get_request(
+            OPENCORPORATES_RECONCILE_URL,
+            logger,
+            user=None,
+            headers=HEADERS,
+            params=params,
+        )
+        if request:
+            data = request.json()
+            if "q0" in data:
+                return data["q0"]["result"]
+            return []
+        return None
+
+    results = cached_fetch(
+        "opencorporates",
+        name,
+        _fetch,
+        params={"jurisdiction": jurisdiction, "limit": limit},
     )
-    if request:
-        data = request.json()
-        if "q0" in data:
-            return data["q0"]
-    return {"result": []}
+    return {"result": results or []}
 
 
 def reconcile_findthatcharity_entity_by_name(
@@ -134,22 +215,30 @@ def reconcile_findthatcharity_entity_by_name(
 ):
     """Reconcile a name to an findthatcharity record"""
     logger.debug("reconcile_findthatcharity_entity_by_name: {}".format(name))
-    query = {"q0": {"query": name, "limit": limit}}
-    _query = json.dumps(query)
-    params = {"queries": [_query]}
-
-    request = get_request(
-        FINDTHATCHARITY_RECONCILE_URL.format(end_point),
-        logger,
-        user=None,
-        headers=HEADERS,
-        params=params,
+    params = reconcile_query_params(name, limit)
+
+    def _fetch():
+        request = get_request(
+            FINDTHATCHARITY_RECONCILE_URL.format(end_point),
+            logger,
+            user=None,
+            headers=HEADERS,
+            params=params,
+        )
+        if request:
+            data = request.json()
+            if "q0" in data:
+                return data["q0"]["result"]
+            return []
+        return None
+
+    results = cached_fetch(
+        "findthatcharity",
+        name,
+        _fetch,
+        params={"end_point": end_point, "limit": limit},
     )
-    if request:
-        data = request.json()
-        if "q0" in data:
-            return data["q0"]
-    return {"result": []}
+    return {"result": results or []}
 
 
 def reconcile_opencorporates_entity_by_id(_id, logger):
@@ -171,6 +260,85 @@ def reconcile_opencorporates_entity_by_id(_id, logger):
     return None
 
 
+def reconcile_opencorporates_entities_by_name(
+    names,
+    logger,
+    jurisdiction="gb",
+    limit=QUERY_LIMIT,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """Reconcile many company names to opencorporates records, in batched requests"""
+    return reconcile_entities_by_name(
+        names,
+        logger,
+        endpoint="opencorporates",
+        url=OPENCORPORATES_RECONCILE_URL,
+        cache_params={"jurisdiction": jurisdiction, "limit": limit},
+        limit=limit,
+        jurisdiction=jurisdiction,
+        chunk_size=chunk_size,
+    )
+
+
+def reconcile_findthatcharity_entities_by_name(
+    names,
+    logger,
+    end_point="all",
+    limit=QUERY_LIMIT,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """Reconcile many names to findthatcharity records, in batched requests"""
+    return reconcile_entities_by_name(
+        names,
+        logger,
+        endpoint="findthatcharity",
+        url=FINDTHATCHARITY_RECONCILE_URL.format(end_point),
+        cache_params={"end_point": end_point, "limit": limit},
+        limit=limit,
+        chunk_size=chunk_size,
+    )
+
+
+def reconcile_entities_by_name(
+    names,
+    logger,
+    endpoint,
+    url,
+    cache_params,
+    limit=QUERY_LIMIT,
+    jurisdiction=None,
+    chunk_size=RECONCILE_BATCH_SIZE,
+):
+    """
+    Reconcile many names using multiple queries per request. Results are
+    stored in the reconcile cache under the same keys as single name queries,
+    so later single name lookups are served from the cache
+    """
+    reconciled = {}
+    pending = []
+    for name in dict.fromkeys(names):
+        cached = reconcile_cache_get(endpoint, name, cache_params)
+        if cached is None:
+            pending.append(name)
+        else:
+            reconciled[name] = {"result": cached}
+
+    for chunk in chunks(pending, chunk_size):
+        logger.debug("reconcile_entities_by_name: {} ({})".format(endpoint, len(chunk)))
+        params = reconcile_query_params(chunk, limit, jurisdiction)
+        request = get_request(url, logger, user=None, headers=HEADERS, params=params)
+        if not request:
+            continue
+
+        data = request.json()
+        for (index, name) in enumerate(chunk):
+            results = data.get("q{}".format(index), {}).get("result", [])
+            reconcile_cache_set(endpoint, name, results, cache_params)
+            reconciled[name] = {"result": results}
+
+    return reconciled
+
+
 def reconcile_findthatcharity_entity_by_id(_id, logger, end_point="all"):
     """Reconcile a findthatcharity id to an findthatcharity record"""
     logger.debug("reconcile_findthatcharity_entity_by_id: {}".format(_id))
@@ -210,11 +378,20 @@ def get_universities(logger):
 # finder functions
 def findthatcharity_by_name(name, logger, end_point="all", min_word_length=2):
     """Find a registered charity/university/local authority etc by name"""
-    ELASTIC_MIN_SCORE = 99
-
     findthatcharity_reconcile = reconcile_findthatcharity_entity_by_name(
         name, logger, end_point
     )
+    return match_findthatcharity_results(
+        name, findthatcharity_reconcile, logger, min_word_length=min_word_length
+    )
+
+
+def match_findthatcharity_results(
+    name, findthatcharity_reconcile, logger, min_word_length=2
+):
+    """Find the findthatcharity reconcile result matching the name"""
+    ELASTIC_MIN_SCORE = 99
+
     if findthatcharity_reconcile:
         results = findthatcharity_reconcile["result"]
 
@@ -267,12 +444,17 @@ def findthatcharity_by_name(name, logger, end_point="all", min_word_length=2):
 
 def findcorporate_by_name(name, logger, jurisdiction="gb"):
     """Find a registered corporate by name"""
-    ELASTIC_MIN_SCORE = 9
-
-    entity_type = "company"
     opencorporates_reconcile = reconcile_opencorporates_entity_by_name(
         name, logger, jurisdiction=jurisdiction
     )
+    return match_opencorporates_results(name, opencorporates_reconcile, logger)
+
+
+def match_opencorporates_results(name, opencorporates_reconcile, logger):
+    """Find the opencorporates reconcile result matching the name"""
+    ELASTIC_MIN_SCORE = 9
+
+    entity_type = "company"
     if opencorporates_reconcile:
         results = opencorporates_reconcile["result"]
 
@@ -323,13 +505,17 @@ def find_organisation_by_number(companies_house_apikey, entity_number, logger):
     """Query companies house for company name"""
     url = COMPANIES_HOUSE_QUERY_URL.format("company", entity_number)
     logger.debug("Companies House Query: {}".format(url))
-    request = get_request(
-        url=url, logger=logger, user=companies_house_apikey, headers=HEADERS
-    )
-    if request:
-        data = request.json()
-        return data["company_name"]
-    return None
+
+    def _fetch():
+        request = get_request(
+            url=url, logger=logger, user=companies_house_apikey, headers=HEADERS
+        )
+        if request:
+            data = request.json()
+            return data["company_name"]
+        return None
+
+    return cached_fetch("companies_house_company", entity_number, _fetch)
 
 
 ############################################################################
@@ -344,21 +530,41 @@ def search_companies_house(
     """Search companies with text"""
 
     query = query.lower().strip()
-    url = COMPANIES_HOUSE_SEARCH_URL.format(
-        query_type, urllib.parse.quote(query), str(limit)
+    url = companies_house_search_url(query, query_type, limit)
+
+    def _fetch():
+        request = get_request(
+            url=url,
+            logger=logger,
+            user=companies_house_apikey,
+            headers=HEADERS,
+        )
+        if request:
+            data = request.json()
+            return data.get("items", [])
+        return None
+
+    items = cached_fetch(
+        "companies_house_search",
+        query,
+        _fetch,
+        params={"query_type": query_type, "limit": limit},
     )
-    request = get_request(
-        url=url,
-        logger=logger,
-        user=companies_house_apikey,
-        headers=HEADERS,
+    if items is None:
+        return (None, None, None)
+    return match_companies_house_items(query, items, logger)
+
+
+def companies_house_search_url(query, query_type="", limit=QUERY_LIMIT):
+    """Companies house search url for a normalised query"""
+    return COMPANIES_HOUSE_SEARCH_URL.format(
+        query_type, urllib.parse.quote(query), str(limit)
     )
 
-    if not request:
-        return (None, None, None)
 
-    data = request.json()
-    for item in data["items"]:
+def match_companies_house_items(query, items, logger):
+    """Find the companies house search item matching the query"""
+    for item in items:
 
         _name = item["title"]
         _id = item["links"]["self"].split("/")[-1]
@@ -398,14 +604,106 @@ def read_json_file(path):
     return None
 
 
-def read_pdf_table(path):
+def iter_json_items(path, prefix):
+    """Stream the items at an ijson prefix of a json file, one at a time"""
+    if path:
+        with open(path, "rb") as file:
+            for item in ijson.items(file, prefix, use_float=True):
+                yield item
+
+
+def read_pdf_table(path, cache=True, logger=None):
     """Read pdf input file tables"""
     if path:
-        dataframe_list = tabula.read_pdf(path, pages="all", multiple_tables=True)
+        if cache:
+            dataframe_list = read_pdf_tables_cached(path, logger)
+        else:
+            dataframe_list = tabula.read_pdf(path, **PDF_TABLE_OPTIONS)
         return dataframe_list[1:]  # we don't need the first table
     return None
 
 
+def pdf_table_cache_dir(path, options=PDF_TABLE_OPTIONS):
+    """
+    Cache directory of a pdf's tables, in a directory per pdf path, keyed by
+    the pdf's content and tabula options
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+
+    path = os.path.abspath(path)
+    pdf_dir = "{}_{}".format(
+        os.path.splitext(os.path.basename(path))[0],
+        hashlib.sha1(path.encode("utf-8")).hexdigest()[:12],
+    )
+    return os.path.normpath(
+        os.path.join(
+            os.path.dirname(__file__), PDF_TABLE_CACHE_DIR, pdf_dir, digest.hexdigest()
+        )
+    )
+
+
+def read_pdf_tables_cached(path, logger=None, options=PDF_TABLE_OPTIONS):
+    """
+    Read all pdf tables with tabula, or from their feather files when the
+    pdf and options are unchanged since the last read
+    """
+    cache_dir = pdf_table_cache_dir(path, options)
+    manifest_path = os.path.join(cache_dir, "tables.json")
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+        if logger:
+            logger.debug("Reading cached pdf tables: {}".format(cache_dir))
+        return [
+            pandas.read_feather(os.path.join(cache_dir, table["path"])).set_axis(
+                table["columns"], axis=1
+            )
+            for table in manifest
+        ]
+
+    dataframe_list = tabula.read_pdf(path, **options)
+    try:
+        write_pdf_tables_cache(cache_dir, dataframe_list)
+        prune_pdf_tables_cache(cache_dir)
+    except (ValueError, TypeError, OSError) as error:
+        # e.g. mixed type columns feather can't store, tabula is used next time
+        if logger:
+            logger.warning("Failed to cache pdf tables: {}".format(error))
+    return dataframe_list
+
+
+def write_pdf_tables_cache(cache_dir, dataframe_list):
+    """Write tables as feather files, the manifest last so partial writes are ignored"""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    manifest = []
+    for (index, dataframe) in enumerate(dataframe_list):
+        table_path = "{}.feather".format(index)
+        # feather needs a default index and unique string column names
+        table = dataframe.reset_index(drop=True)
+        table.columns = [str(column) for column in range(len(table.columns))]
+        table.to_feather(os.path.join(cache_dir, table_path))
+        manifest.append({"path": table_path, "columns": list(dataframe.columns)})
+
+    with open(os.path.join(cache_dir, "tables.json"), "w") as file:
+        json.dump(manifest, file)
+
+
+def prune_pdf_tables_cache(cache_dir):
+    """Remove the tables cached for previous versions of the same pdf"""
+    pdf_dir = os.path.dirname(cache_dir)
+    for name in os.listdir(pdf_dir):
+        path = os.path.join(pdf_dir, name)
+        if path != cache_dir and os.path.isdir(path):
+            shutil.rmtree(path)
+
+
 def read_csv_as_dataframe(path, null_replace="N/A", index_col="id"):
     """Read csv input file"""
     if path:
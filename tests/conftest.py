@@ -0,0 +1,10 @@
+"""
+Module for test configuration, the package is imported from lib as in setup.sh
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
@@ -0,0 +1,67 @@
+"""
+Module for extraction tests
+"""
+# -*- coding: utf-8 -*-
+
+# sys libs
+import logging
+
+# third party libs
+import pandas
+import pytest
+
+# local libs
+from bankofparliament.registry import RelationshipBuffer
+
+ENTITIES_CSV = """id,entity_type,name,aliases
+0,person,The Crown,the crown
+1,government_organisation,Judicary,judicary
+"""
+RELATIONSHIPS_CSV = """id,source,relationship_type,target,date,amount,text,link,resolved
+0,The Crown,constitutional_head_of,Judicary,N/A,N/A,['Constitutional head of Judicary'],N/A,N/A
+"""
+
+
+def write_csv_files(path):
+    """Write the entities and relationships csv files, returns their paths"""
+    entities = path / "entities.csv"
+    entities.write_text(ENTITIES_CSV)
+    relationships = path / "relationships.csv"
+    relationships.write_text(RELATIONSHIPS_CSV)
+    return (str(entities), str(relationships))
+
+
+def test_relationship_buffer_dataframe_columns(tmp_path):
+    """Buffer columns may be a dataframe's column index"""
+    (_entities, relationships) = write_csv_files(tmp_path)
+    columns = pandas.read_csv(relationships, index_col="id").columns
+
+    buffer = RelationshipBuffer(columns=columns)
+    assert buffer.columns == list(columns)
+    assert len(buffer) == 0
+
+
+def test_extract_small_csv(tmp_path, monkeypatch):
+    """The extractor constructs and solves relationships of small csv files"""
+    spacy = pytest.importorskip("spacy")
+    from bankofparliament import extraction
+
+    # a blank pipeline stands in for the downloaded ner model
+    monkeypatch.setattr(extraction.spacy, "load", lambda name: spacy.blank("en"))
+
+    (entities, relationships) = write_csv_files(tmp_path)
+    extract = extraction.NamedEntityExtract(
+        entities=entities,
+        custom_entities=None,
+        relationships=relationships,
+        companies_house_apikey=None,
+        prompt=False,
+        from_index=0,
+        to_index=None,
+        logger=logging.getLogger(__name__),
+    )
+    extract.execute()
+
+    output = pandas.read_csv(tmp_path / "extracted" / "relationships.csv")
+    assert list(output["target"]) == ["JUDICARY"]
+    assert list(output["resolved"]) == [True]